@@ -0,0 +1,424 @@
+#!/usr/bin/env python3
+# Contact: Josh Port (joshua_port@uri.edu)
+#
+# Benchmarks for scale_and_subset.py using synthetic input files
+# Run with -h to see the available benchmarks; results are printed as a table, or as JSON with -json
+# JSON results carry the git revision of this checkout, so they can be compared across commits
+#
+import argparse
+import datetime
+import json
+import netCDF4
+import numpy
+import os
+import subprocess
+import tempfile
+import time
+import scale_and_subset
+
+# Synthetic wind grids start here and have this spacing in degrees, whatever their format
+WIND_XLL = -72.0
+WIND_YLL = 40.0
+WIND_D = 0.05
+
+
+def write_owi_netcdf(filename, n_lat, n_lon, n_times, chunk_time=1, complevel=2):
+    # Synthetic OWI NetCDF file with the same layout OwiNetcdf reads
+    rng = numpy.random.default_rng(0)
+    nc = netCDF4.Dataset(filename, "w")
+    main = nc.createGroup("Main")
+    main.createDimension("time", None)
+    main.createDimension("yi", n_lat)
+    main.createDimension("xi", n_lon)
+    lon, lat = numpy.meshgrid(WIND_XLL + WIND_D * numpy.arange(n_lon), WIND_YLL + WIND_D * numpy.arange(n_lat))
+    main.createVariable("lon", "f8", ("yi", "xi"))[:] = lon
+    main.createVariable("lat", "f8", ("yi", "xi"))[:] = lat
+    var_time = main.createVariable("time", "i8", "time")
+    var_time.units = "minutes since 1990-01-01 00:00:00 Z"
+    chunks = (chunk_time, n_lat, n_lon)
+    var_u10 = main.createVariable("U10", "f4", ("time", "yi", "xi"), zlib=complevel > 0, complevel=max(complevel, 1), chunksizes=chunks)
+    var_v10 = main.createVariable("V10", "f4", ("time", "yi", "xi"), zlib=complevel > 0, complevel=max(complevel, 1), chunksizes=chunks)
+    start = (datetime.datetime(2020, 1, 1) - datetime.datetime(1990, 1, 1)).total_seconds() / 60
+    for i in range(n_times):
+        var_time[i] = start + 60 * i
+        var_u10[i, :, :] = rng.normal(0, 15, (n_lat, n_lon))
+        var_v10[i, :, :] = rng.normal(0, 15, (n_lat, n_lon))
+    nc.close()
+
+
+def synthetic_wind(n_lat, n_lon, n_times):
+    # Independent normal U and V for each time slice; wind readers and scaling do not care whether the field is realistic
+    rng = numpy.random.default_rng(0)
+    for i in range(n_times):
+        yield (datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=i), rng.normal(0, 15, (n_lat, n_lon)), rng.normal(0, 15, (n_lat, n_lon)))
+
+
+def write_owi_ascii(filename, n_lat, n_lon, n_times):
+    # Synthetic OWI ASCII file in the fixed-width layout OwiAsciiWind reads: a file header, then per time slice a grid header and 8 values per line
+    slices = list(synthetic_wind(n_lat, n_lon, n_times))
+    with open(filename, "w") as file:
+        file.write("Oceanweather WIN/PRE Format{:28s}{:s}     {:s}\n".format("", slices[0][0].strftime("%Y%m%d%H"), slices[-1][0].strftime("%Y%m%d%H")))
+        for date, uvel, vvel in slices:
+            file.write("iLat={:4d}iLong={:4d}DX={:6.4f}DY={:6.4f}SWLat={:8.5f}SWLon={:8.4f}DT={:s}\n".format(
+                n_lat, n_lon, WIND_D, WIND_D, WIND_YLL, WIND_XLL, date.strftime("%Y%m%d%H%M")))
+            for values in (uvel, vvel):
+                values = values.reshape(-1)
+                for i in range(0, len(values), 8):
+                    file.write("".join(" {:9.4f}".format(value) for value in values[i:i + 8]) + "\n")
+
+
+def write_wnd(filename, wind_inp_filename, n_lat, n_lon, n_times):
+    # Synthetic WND file and its Wind_Inp.txt; returns the WndWindInp, since the grid size it derives from the bounds is what the WND file has to match
+    with open(wind_inp_filename, "w") as file:
+        file.write("Synthetic\nSynthetic\n2020 01 01 00 00 00\n1\n{:d}\n{:g} {:g}\n{:g} {:g}\n{:d}\n".format(
+            n_times, WIND_XLL, WIND_XLL + WIND_D * (n_lon - 1), WIND_YLL, WIND_YLL + WIND_D * (n_lat - 1), round(1 / WIND_D)))
+    wind_inp = scale_and_subset.WndWindInp(wind_inp_filename)
+    with open(filename, "w") as file:
+        for date, uvel, vvel in synthetic_wind(wind_inp.num_lats(), wind_inp.num_lons(), n_times):
+            for u, v in zip(uvel.reshape(-1), vvel.reshape(-1)):
+                file.write("{:9.4f} {:9.4f}\n".format(u, v))
+    return wind_inp
+
+
+def synthetic_roughness(lon, lat):
+    # Water (z0 = 0.0033) south of a wavy coastline and random land roughness north of it, with a few lakes, so both the open-water
+    # and the mixed land/water paths of the scaling are exercised
+    rng = numpy.random.default_rng(0)
+    lon_grid, lat_grid = numpy.meshgrid(lon, lat)
+    x = (lon_grid - lon[0]) / max(lon[-1] - lon[0], 1e-9)
+    y = (lat_grid - lat[0]) / max(lat[-1] - lat[0], 1e-9)
+    land = (y > 0.4 + 0.1 * numpy.sin(12 * x)) & (numpy.hypot(x - 0.7, y - 0.8) > 0.05)
+    return numpy.where(land, rng.uniform(0.02, 0.9, land.shape), 0.0033)
+
+
+def write_roughness(filename, lon, lat, land_rough):
+    # Roughness file in the layout Roughness.get reads
+    nc = netCDF4.Dataset(filename, "w")
+    nc.createDimension("lon", len(lon))
+    nc.createDimension("lat", len(lat))
+    nc.createVariable("lon", "f8", "lon")[:] = lon
+    nc.createVariable("lat", "f8", "lat")[:] = lat
+    nc.createVariable("land_rough", "f8", ("lat", "lon"))[:] = land_rough
+    nc.close()
+
+
+def time_owi_netcdf_reads(filename, legacy):
+    # Per-slice read time, either through OwiNetcdf or the previous whole-variable indexing
+    if legacy:
+        nc = netCDF4.Dataset(filename, "r")
+        n_times = nc["Main"].variables["time"].size
+        start = time.perf_counter()
+        for idx in range(n_times):
+            nc["Main"].variables["U10"][:][:][idx]
+            nc["Main"].variables["V10"][:][:][idx]
+        elapsed = time.perf_counter() - start
+        nc.close()
+    else:
+        owi_netcdf = scale_and_subset.OwiNetcdf(filename)
+        n_times = owi_netcdf.num_times()
+        start = time.perf_counter()
+        for idx in range(n_times):
+            owi_netcdf.get(idx)
+        elapsed = time.perf_counter() - start
+        owi_netcdf.close()
+    return elapsed / n_times
+
+
+def bench_owi_netcdf_read(args, workdir):
+    results = []
+    for n_times in args.times:
+        filename = os.path.join(workdir, "owi_{:d}.nc".format(n_times))
+        write_owi_netcdf(filename, args.nlat, args.nlon, n_times, args.chunk_time, args.complevel)
+        for legacy in (True, False):
+            if legacy and n_times > args.legacy_max_times:
+                continue
+            results.append({"benchmark": "owi-netcdf-read", "reader": "legacy" if legacy else "OwiNetcdf", "n_lat": args.nlat, "n_lon": args.nlon,
+                            "n_times": n_times, "chunk_time": args.chunk_time, "complevel": args.complevel,
+                            "seconds_per_slice": time_owi_netcdf_reads(filename, legacy)})
+    return results
+
+
+def synthetic_hr_wind(n_lat, n_lon, n_times):
+    # Smooth vortex-like winds plus noise, so compression sees something closer to real output than pure noise
+    rng = numpy.random.default_rng(0)
+    y, x = numpy.meshgrid(numpy.linspace(-1, 1, n_lat), numpy.linspace(-1, 1, n_lon), indexing="ij")
+    for i in range(n_times):
+        x_ctr = x - 0.5 + i / max(1, n_times)
+        r = numpy.hypot(x_ctr, y) + 0.05
+        speed = 40 * r / 0.2 * numpy.exp(1 - r / 0.2)
+        yield (-speed * y / r + rng.normal(0, 1, r.shape), speed * x_ctr / r + rng.normal(0, 1, r.shape),
+               datetime.datetime(2020, 1, 1) + datetime.timedelta(hours=i))
+
+
+def time_netcdf_writes(filename, n_lat, n_lon, n_times, chunks, complevel, shuffle, packed):
+    lon = -72 + 0.001 * numpy.arange(n_lon)
+    lat = 40 + 0.001 * numpy.arange(n_lat)
+    slices = list(synthetic_hr_wind(n_lat, n_lon, n_times))
+    start = time.perf_counter()
+    output = scale_and_subset.NetcdfOutput(filename, lon, lat, chunks, complevel, shuffle, packed)
+    for idx, (u, v, date) in enumerate(slices):
+        output.append(idx, date, u, v, None)
+    output.close()
+    return time.perf_counter() - start
+
+
+def bench_netcdf_write(args, workdir):
+    results = []
+    chunk_options = [None, [1, args.hrnlat, args.hrnlon], [1, 256, 256]]
+    for chunks in chunk_options:
+        for complevel in args.ocomplevel:
+            for shuffle in (False, True):
+                for packed in (False, True):
+                    if complevel == 0 and shuffle:
+                        continue
+                    filename = os.path.join(workdir, "out")
+                    elapsed = time_netcdf_writes(filename, args.hrnlat, args.hrnlon, args.hrtimes, chunks, complevel, shuffle, packed)
+                    size = os.path.getsize(filename + ".nc")
+                    os.remove(filename + ".nc")
+                    # Throughput is of the float32 spd and dir values the output represents, whether or not they are packed
+                    raw_mb = 2 * 4 * args.hrnlat * args.hrnlon * args.hrtimes / 1e6
+                    results.append({"benchmark": "netcdf-write", "n_lat": args.hrnlat, "n_lon": args.hrnlon, "n_times": args.hrtimes,
+                                    "chunks": "default" if chunks is None else "x".join(str(c) for c in chunks), "complevel": complevel,
+                                    "shuffle": shuffle, "packed": packed, "seconds_per_slice": elapsed / args.hrtimes,
+                                    "baseline": chunks is None and complevel == 2 and shuffle and not packed,  # What NetcdfOutput writes by default
+                                    "mb_per_second": raw_mb / elapsed, "file_mb": size / 1e6})
+    return results
+
+
+def check_pack_round_trip(args, workdir):
+    # Not a timing: writes synthetic slices with a calm point (0 m/s) and a missing point (NaN) through each output format, packed and not,
+    # reads them back and reports the largest error, raising if a calm point comes back missing or a missing point comes back with a value
+    results = []
+    lon = -72 + 0.001 * numpy.arange(args.hrnlon)
+    lat = 40 + 0.001 * numpy.arange(args.hrnlat)
+    slices = []
+    for u, v, date in synthetic_hr_wind(args.hrnlat, args.hrnlon, args.hrtimes):
+        u[0, 0], v[0, 0] = 0.0, 0.0
+        u[-1, -1], v[-1, -1] = numpy.nan, numpy.nan
+        slices.append((u, v, date))
+    for ofmt in ("netcdf", "chunked"):
+        for packed in (False, True):
+            filename = os.path.join(workdir, "round_trip")
+            if ofmt == "netcdf":
+                output = scale_and_subset.NetcdfOutput(filename, lon, lat, packed=packed)
+            else:
+                output = scale_and_subset.ChunkedOutput(filename, lon, lat, packed=packed)
+            for idx, (u, v, date) in enumerate(slices):
+                output.append(idx, date, u, v, None)
+            output.close()
+            spd_error, dir_error, calm_valid, missing_match = 0.0, 0.0, True, True
+            nc = netCDF4.Dataset(filename + ".nc") if ofmt == "netcdf" else None
+            reader = scale_and_subset.ChunkedOutputReader(filename + ".chunks") if ofmt == "chunked" else None
+            for idx, (u, v, date) in enumerate(slices):
+                if nc is not None:
+                    spd = numpy.ma.filled(nc["Main"]["spd"][idx].astype(numpy.float64), numpy.nan)
+                    direction = numpy.ma.filled(nc["Main"]["dir"][idx].astype(numpy.float64), numpy.nan)
+                else:
+                    _, spd, direction = reader.get(idx)
+                spd_ref, dir_ref = scale_and_subset.spd_dir_from_uv(u, v)
+                spd_error = max(spd_error, float(numpy.nanmax(numpy.abs(spd - spd_ref))))
+                dir_error = max(dir_error, float(numpy.nanmax(scale_and_subset.angle_diff(direction, dir_ref))))
+                calm_valid = calm_valid and not numpy.isnan(spd[0, 0])
+                missing_match = missing_match and bool(numpy.array_equal(numpy.isnan(spd), numpy.isnan(spd_ref)))
+            if nc is not None:
+                nc.close()
+            results.append({"benchmark": "pack-round-trip", "ofmt": ofmt, "packed": packed, "max_spd_error": spd_error, "max_dir_error": dir_error,
+                            "calm_points_valid": calm_valid, "missing_points_match": missing_match})
+            if not calm_valid or not missing_match:
+                raise RuntimeError("Round trip through " + ofmt + (" packed" if packed else "") + " output lost or invented values")
+    return results
+
+
+def time_per_call(function, calls):
+    # Average seconds per call of function(i) for i in range(calls)
+    start = time.perf_counter()
+    for i in range(calls):
+        function(i)
+    return (time.perf_counter() - start) / calls
+
+
+def bench_pipeline(args, workdir):
+    # Each stage of a scale_and_subset.py run on the same synthetic inputs, timed separately:
+    # reading wind (every format and reader), reading roughness, directional z0 generation, planning, roughness_adjust, restitching and output
+    results = []
+    n_times = args.hrtimes
+    hr_lon = WIND_XLL + WIND_D + args.hrres * numpy.arange(args.hrnlon)
+    hr_lat = WIND_YLL + WIND_D + args.hrres * numpy.arange(args.hrnlat)
+    if hr_lon[-1] >= WIND_XLL + WIND_D * (args.nlon - 1) or hr_lat[-1] >= WIND_YLL + WIND_D * (args.nlat - 1):
+        raise RuntimeError("The synthetic high-res grid does not fit in the wind grid; use a larger nlat/nlon or a smaller hrres")
+    common = {"benchmark": "pipeline", "n_lat": args.nlat, "n_lon": args.nlon, "hr_n_lat": args.hrnlat, "hr_n_lon": args.hrnlon, "n_times": n_times}
+
+    # Synthetic inputs
+    owi_ascii = os.path.join(workdir, "pipeline.owi")
+    owi_netcdf = os.path.join(workdir, "pipeline_owi.nc")
+    wnd = os.path.join(workdir, "pipeline.wnd")
+    hr = os.path.join(workdir, "pipeline_hr.nc")
+    wr = os.path.join(workdir, "pipeline_wr.nc")
+    write_owi_ascii(owi_ascii, args.nlat, args.nlon, n_times)
+    write_owi_netcdf(owi_netcdf, args.nlat, args.nlon, n_times, args.chunk_time, args.complevel)
+    wind_inp = write_wnd(wnd, os.path.join(workdir, "Wind_Inp.txt"), args.nlat, args.nlon, n_times)
+    write_roughness(hr, hr_lon, hr_lat, synthetic_roughness(hr_lon, hr_lat))
+    wind_lon = WIND_XLL + WIND_D * numpy.arange(args.nlon)
+    wind_lat = WIND_YLL + WIND_D * numpy.arange(args.nlat)
+    write_roughness(wr, wind_lon, wind_lat, synthetic_roughness(wind_lon, wind_lat))
+
+    # Reading
+    with open(owi_ascii, "r") as file:
+        readers = {"owi-ascii": scale_and_subset.OwiAsciiWind(file.readlines()), "owi-ascii-mmap": scale_and_subset.OwiAsciiWindMmap(owi_ascii),
+                   "owi-netcdf": scale_and_subset.OwiNetcdf(owi_netcdf)}
+    with open(wnd, "r") as file:
+        readers["wnd"] = scale_and_subset.WndWind(file.readlines(), wind_inp)
+    readers["wnd-mmap"] = scale_and_subset.WndWindMmap(wnd, wind_inp)
+    for name, reader in readers.items():
+        results.append(dict(common, stage="read", variant=name, seconds_per_slice=time_per_call(reader.get, n_times)))
+    start = time.perf_counter()
+    z0_hr = scale_and_subset.Roughness(*scale_and_subset.Roughness.get(hr))
+    z0_wr = scale_and_subset.Roughness(*scale_and_subset.Roughness.get(wr))
+    results.append(dict(common, stage="read", variant="roughness", seconds=time.perf_counter() - start))
+
+    # Directional z0 generation
+    # With more than one method, each cube is then compared to the loop one (or the first method given), as max absolute and relative
+    # differences and whether the same points have no value
+    lon_grid, lat_grid = numpy.meshgrid(z0_hr.lon(), z0_hr.lat())
+    interpolants = {}
+    for method in args.z0method:
+        start = time.perf_counter()
+        interpolants[method] = scale_and_subset.generate_directional_z0_interpolant(lon_grid, lat_grid, z0_hr.land_rough(), args.sigma, args.r, method)
+        results.append(dict(common, stage="z0-generate", variant=method, sigma=args.sigma, radius=args.r, seconds=time.perf_counter() - start))
+    reference = "loop" if "loop" in interpolants else args.z0method[0]
+    cube_ref = interpolants[reference].values
+    for method, interpolant in interpolants.items():
+        if method == reference:
+            continue
+        diff = numpy.abs(interpolant.values - cube_ref)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            rel_diff = numpy.where(cube_ref != 0, diff / numpy.abs(cube_ref), numpy.where(diff == 0, 0.0, numpy.inf))
+        results.append(dict(common, stage="accuracy", variant="z0-" + method + "-vs-" + reference, sigma=args.sigma, radius=args.r,
+                            max_abs_diff=float(numpy.nanmax(diff)) if not numpy.isnan(diff).all() else 0.0,
+                            max_rel_diff=float(numpy.nanmax(rel_diff)) if not numpy.isnan(rel_diff).all() else 0.0,
+                            nan_match=bool(numpy.array_equal(numpy.isnan(interpolant.values), numpy.isnan(cube_ref)))))
+        del diff, rel_diff
+    z0_directional = scale_and_subset.DirectionalZ0.from_interpolant(interpolants[args.z0method[-1]], args.sigma, args.r)
+    del lon_grid, lat_grid, interpolants, cube_ref
+
+    # Planning, scaling, restitching and output, for each scaling logic and precision
+    # With more than one precision, each is then compared to float64 (or the first one given), as max |spd| and |dir| differences
+    # over every slice and whether the same points have no direction
+    reader = readers["owi-netcdf"]
+    for sl in ("adcirc", "up-down"):
+        spd_dir = {}
+        for precision in args.precision:
+            dtype = numpy.dtype(precision)
+            variant = sl + "-" + precision
+            z0_hr_dtype = scale_and_subset.Roughness(z0_hr.lon(), z0_hr.lat(), z0_hr.land_rough().astype(dtype))
+            z0_wr_dtype = scale_and_subset.Roughness(z0_wr.lon(), z0_wr.lat(), z0_wr.land_rough().astype(dtype))
+            start = time.perf_counter()
+            wind_plan = scale_and_subset.WindPlan(sl, reader.grid(), z0_wr_dtype)
+            subd_plan, subd_start_index, subd_end_index = scale_and_subset.subd_prep(z0_hr_dtype, z0_directional, wind_plan, args.t)
+            results.append(dict(common, stage="plan", variant=variant, subdomains=args.t, seconds=time.perf_counter() - start))
+            wind_w_grid = [scale_and_subset.wind_adjust(reader.get(i).astype(dtype), None, wind_plan, None) for i in range(n_times)]
+            subd_wind_scaled = [[scale_and_subset.roughness_adjust([wind_w_grid[i], plan]) for plan in subd_plan] for i in range(n_times)]
+            # Every subdomain runs in turn, so this is the work per slice that t threads or processes would share
+            seconds = time_per_call(lambda i: [scale_and_subset.roughness_adjust([wind_w_grid[i], plan]) for plan in subd_plan], n_times)
+            results.append(dict(common, stage="roughness_adjust", variant=variant, subdomains=args.t, seconds_per_slice=seconds))
+            hr_shape = z0_hr.land_rough().shape
+            scaled = []
+            seconds = time_per_call(lambda i: scaled.append(scale_and_subset.subd_restitch_domain(subd_wind_scaled[i], subd_start_index, subd_end_index,
+                                                                                                   hr_shape, args.t, dtype)), n_times)
+            results.append(dict(common, stage="restitch", variant=variant, subdomains=args.t, seconds_per_slice=seconds))
+            output = scale_and_subset.NetcdfOutput(os.path.join(workdir, "pipeline_out"), z0_hr.lon(), z0_hr.lat())
+            seconds = time_per_call(lambda i: output.append(i, scaled[i][2], scaled[i][0], scaled[i][1], None), n_times)
+            output.close()
+            results.append(dict(common, stage="NetcdfOutput.append", variant=variant, seconds_per_slice=seconds))
+            spd_dir[precision] = [scale_and_subset.spd_dir_from_uv(u.astype(numpy.float64), v.astype(numpy.float64)) for u, v, _ in scaled]
+        reference = "float64" if "float64" in spd_dir else args.precision[0]
+        for precision in spd_dir:
+            if precision == reference:
+                continue
+            spd_diff, dir_diff, nan_match = 0.0, 0.0, True
+            for (spd, direction), (spd_ref, dir_ref) in zip(spd_dir[precision], spd_dir[reference]):
+                spd_diff = max(spd_diff, float(numpy.nanmax(numpy.abs(spd - spd_ref))))
+                dir_diff = max(dir_diff, float(numpy.nanmax(scale_and_subset.angle_diff(direction, dir_ref))))
+                nan_match = nan_match and bool(numpy.array_equal(numpy.isnan(direction), numpy.isnan(dir_ref)))
+            results.append(dict(common, stage="accuracy", variant=sl + "-" + precision + "-vs-" + reference, max_spd_diff=spd_diff, max_dir_diff=dir_diff,
+                                nan_match=nan_match))
+    for reader in readers.values():
+        if hasattr(reader, "close"):
+            reader.close()
+    return results
+
+
+BENCHMARKS = {"owi-netcdf-read": bench_owi_netcdf_read, "netcdf-write": bench_netcdf_write, "pipeline": bench_pipeline, "pack-round-trip": check_pack_round_trip}
+
+
+def print_table(results):
+    keys = []
+    for result in results:
+        keys += [key for key in result if key not in keys]
+    print("  ".join("{:>17s}".format(key) for key in keys))
+    for result in results:
+        print("  ".join("{:>17.6g}".format(result[key]) if isinstance(result.get(key), float) else "{:>17s}".format(str(result.get(key, "")))
+                        for key in keys))
+
+
+def git_revision():
+    # Commit of the checkout this script is in, or None outside a git repository
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)), capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark scale_and_subset.py on synthetic data")
+    parser.add_argument("-b", metavar="benchmark", type=str, nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS),
+                        help="Benchmarks to run. Supported values: " + ", ".join(BENCHMARKS), required=False)
+    parser.add_argument("-chunk_time", metavar="chunk_time", type=int, help="Time steps per chunk in synthetic OWI NetCDF files", required=False, default=1)
+    parser.add_argument("-complevel", metavar="complevel", type=int, help="zlib level for synthetic OWI NetCDF files; 0 disables compression",
+                        required=False, default=2)
+    parser.add_argument("-hrnlat", metavar="hr_n_lat", type=int, help="Number of latitudes in the synthetic output grid", required=False, default=1000)
+    parser.add_argument("-hrnlon", metavar="hr_n_lon", type=int, help="Number of longitudes in the synthetic output grid", required=False, default=1000)
+    parser.add_argument("-hrres", metavar="hr_resolution", type=float, help="Spacing of the synthetic high-res grid for the pipeline benchmark, in degrees",
+                        required=False, default=0.001)
+    parser.add_argument("-hrtimes", metavar="hr_n_times", type=int, help="Time slices written per output benchmark and scaled per pipeline benchmark",
+                        required=False, default=8)
+    parser.add_argument("-json", metavar="json_file", type=str, help="Write results as JSON to this file instead of printing a table", required=False)
+    parser.add_argument("-legacy_max_times", metavar="legacy_max_times", type=int,
+                        help="Skip the legacy OWI NetCDF reader for files longer than this, since it scales quadratically", required=False, default=200)
+    parser.add_argument("-nlat", metavar="n_lat", type=int, help="Number of latitudes in the synthetic wind grid", required=False, default=200)
+    parser.add_argument("-nlon", metavar="n_lon", type=int, help="Number of longitudes in the synthetic wind grid", required=False, default=200)
+    parser.add_argument("-ocomplevel", metavar="complevel", type=int, nargs="+", help="Output zlib levels to benchmark; 0 disables compression",
+                        required=False, default=[0, 1, 2, 4])
+    parser.add_argument("-precision", metavar="precision", type=str, nargs="+", choices=["float64", "float32"],
+                        help="Precisions to run the pipeline benchmark's scaling stages in", required=False, default=["float64"])
+    parser.add_argument("-r", metavar="radius", type=int, help="Sector radius for directional z0 generation, in meters", required=False, default=3000)
+    parser.add_argument("-sigma", metavar="sigma", type=int, help="Weighting parameter for directional z0 generation, in meters", required=False, default=1000)
+    parser.add_argument("-t", metavar="subdomains", type=int, help="Number of row subdomains the pipeline benchmark splits the high-res grid into",
+                        required=False, default=4)
+    parser.add_argument("-times", metavar="n_times", type=int, nargs="+", help="Time slice counts to benchmark", required=False, default=[12, 48, 192])
+    parser.add_argument("-z0method", metavar="z0_method", type=str, nargs="+", choices=["fft", "loop"],
+                        help="Directional z0 generation methods to time, and to compare to the loop one; loop is much slower", required=False, default=["fft"])
+    parser.add_argument("-workdir", metavar="workdir", type=str, help="Directory for synthetic files; a temporary directory is used by default",
+                        required=False)
+    return parser
+
+
+def main():
+    args = build_parser().parse_args()
+    with tempfile.TemporaryDirectory(dir=args.workdir) as workdir:
+        results = []
+        for name in args.b:
+            results += BENCHMARKS[name](args, workdir)
+    if args.json:
+        revision = git_revision()
+        for result in results:
+            result["revision"] = revision
+        with open(args.json, "w") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print_table(results)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,39 @@
+#!/usr/bin/env python3
+# Contact: Josh Port (joshua_port@uri.edu)
+#
+# Converts the chunked output of scale_and_subset.py (-ofmt chunked) to the NetCDF file it writes with -ofmt netcdf
+#
+import argparse
+import scale_and_subset
+
+
+def chunked_to_netcdf(dirname, filename, chunks=None, complevel=2, shuffle=True, packed=False):
+    reader = scale_and_subset.ChunkedOutputReader(dirname)
+    num_times = reader.num_times()
+    output = scale_and_subset.NetcdfOutput(filename, reader.lon(), reader.lat(), chunks, complevel, shuffle, packed)
+    for idx in range(num_times):
+        print("INFO: Converting time slice {:d} of {:d}".format(idx + 1, num_times), flush=True)
+        date, spd, direction = reader.get(idx)
+        output.append_spd_dir(idx, date, spd, direction, None)
+    output.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert chunked scale_and_subset.py output to NetCDF")
+    parser.add_argument("-i", metavar="infile", type=str, help="Chunked output directory (<o>.chunks) to be converted", required=True)
+    parser.add_argument("-o", metavar="outfile", type=str, help="Name of NetCDF file to be created, without .nc", required=True)
+    parser.add_argument("-ochunk", metavar=("time", "latitude", "longitude"), type=int, nargs=3,
+                        help="Chunk shape of spd and dir in the output file; the netCDF4 default is used if not provided", required=False)
+    parser.add_argument("-ocomplevel", metavar="complevel", type=int, help="zlib compression level (0-9) of spd and dir in the output file; 0 disables compression",
+                        required=False, default=2)
+    parser.add_argument("-opack", help="Add this flag to store spd and dir as int16 with scale_factor/add_offset instead of float32",
+                        action='store_true', required=False, default=False)
+    parser.add_argument("-oshuffle", metavar="shuffle", type=int, choices=[0, 1], nargs="?", const=1,
+                        help="1 (the default, as netCDF4 does) applies the HDF5 shuffle filter before compressing spd and dir; 0 disables it",
+                        required=False, default=1)
+    args = parser.parse_args()
+    chunked_to_netcdf(args.i, args.o, args.ochunk, args.ocomplevel, args.oshuffle == 1, args.opack)
+
+
+if __name__ == '__main__':
+    main()
@@ -7,24 +7,42 @@
 import argparse
 import concurrent.futures
 import datetime
+import hashlib
+import itertools
+import json
 import math
+import mmap
+import multiprocessing.shared_memory
 import netCDF4
 import numpy
+import os
 import pandas
 import pickle
 import pyproj
+import queue
+import resource
 import scipy.interpolate
+import scipy.signal
+import scipy.sparse
+import shutil
+import sys
 import threading
+import time
+import zlib
+
+
+MEAN_EARTH_RADIUS = 6371008.8  # m, IUGG mean radius
 
 
 class WindGrid:
     def __init__(self, lon, lat):
         self.__n_longitude = len(lon)
         self.__n_latitude = len(lat)
-        self.__d_longitude = round(lon[1] - lon[0], 4)
-        self.__d_latitude = round(lat[1] - lat[0], 4)
-        self.__lon = numpy.empty([self.__n_latitude, self.__n_longitude], dtype=numpy.float64)
-        self.__lat = numpy.empty([self.__n_latitude, self.__n_longitude], dtype=numpy.float64)
+        self.__d_longitude = round(lon[1] - lon[0], 4) if len(lon) > 1 else 0.0
+        self.__d_latitude = round(lat[1] - lat[0], 4) if len(lat) > 1 else 0.0
+        self.__lon = None
+        self.__lat = None
+        self.__unit_sphere = None
         lon = numpy.array(lon)
         lat = numpy.array(lat)
         lon = numpy.where(lon > 180, lon - 360, lon)
@@ -32,19 +50,34 @@ class WindGrid:
         self.__yll = min(lat)
         self.__xur = max(lon)
         self.__yur = max(lat)
-        self.__lon, self.__lat = numpy.meshgrid(lon, lat)  # sparse=True is an avenue to explore for saving memory
         self.__lon1d = numpy.array(lon)
         self.__lat1d = numpy.array(lat)
 
+    def __meshgrid(self):
+        # 2D coordinates are only built if something asks for them; most of the pipeline works from lon1d and lat1d
+        if self.__lon is None:
+            self.__lon, self.__lat = numpy.meshgrid(self.__lon1d, self.__lat1d)  # sparse=True is an avenue to explore for saving memory
+
     def lon(self):
+        self.__meshgrid()
         return self.__lon
 
     def lat(self):
+        self.__meshgrid()
         return self.__lat
 
     def lon1d(self):
         return self.__lon1d
 
+    def unit_sphere(self):
+        # Sines and cosines of lat1d and lon1d, built once per grid; the unit-sphere vector of point (i, j) is
+        # (cos_lat[i] * cos_lon[j], cos_lat[i] * sin_lon[j], sin_lat[i]), so great-circle distances need no 2D coordinates
+        if self.__unit_sphere is None:
+            lat_rad = numpy.radians(self.__lat1d.astype(numpy.float64))
+            lon_rad = numpy.radians(self.__lon1d.astype(numpy.float64))
+            self.__unit_sphere = (numpy.cos(lat_rad), numpy.sin(lat_rad), numpy.cos(lon_rad), numpy.sin(lon_rad))
+        return self.__unit_sphere
+
     def lat1d(self):
         return self.__lat1d
 
@@ -94,14 +127,77 @@ class WindGrid:
 
     @staticmethod
     def interpolate_to_grid(original_grid, original_data, new_grid):
-        func = scipy.interpolate.RectBivariateSpline(original_grid.lat1d(), original_grid.lon1d(), original_data, kx=1, ky=1)
-        return func(new_grid.lat1d(), new_grid.lon1d())
+        regridder = Regridder.get(original_grid.lon1d(), original_grid.lat1d(), new_grid.lon1d(), new_grid.lat1d())
+        return regridder.apply(original_data)[0]
+
+
+class Regridder:
+    # Bilinear regridding from one rectilinear grid to another, stored as a sparse (n_target, n_source) matrix so the weights
+    # and indices are computed once per grid pair; matches RectBivariateSpline with kx=ky=1, which clamps targets outside the
+    # source grid to its edges
+    # The weights are calculated in float64 and stored as dtype, so fields of that dtype are regridded without being upcast
+    def __init__(self, src_lon, src_lat, tgt_lon, tgt_lat, src_shape=None, tgt_shape=None, matrix=None, dtype=numpy.float64):
+        if matrix is not None:
+            # Wrap an operator that was already built, e.g. one attached from shared memory
+            self.__src_shape = src_shape
+            self.__tgt_shape = tgt_shape
+            self.__matrix = matrix
+            return
+        self.__src_shape = (len(src_lat), len(src_lon))
+        self.__tgt_shape = (len(tgt_lat), len(tgt_lon))
+        weights_lat = Regridder.__weights_1d(src_lat, tgt_lat)
+        weights_lon = Regridder.__weights_1d(src_lon, tgt_lon)
+        self.__matrix = scipy.sparse.kron(weights_lat, weights_lon, format="csr")  # Row-major flattening puts longitude fastest
+        self.__matrix.eliminate_zeros()
+        self.__matrix = self.__matrix.astype(dtype, copy=False)
+
+    def src_shape(self):
+        return self.__src_shape
+
+    def tgt_shape(self):
+        return self.__tgt_shape
+
+    def matrix(self):
+        return self.__matrix
+
+    @staticmethod
+    def __weights_1d(src, tgt):
+        src = numpy.asarray(src, dtype=numpy.float64)
+        tgt = numpy.clip(numpy.asarray(tgt, dtype=numpy.float64), src[0], src[-1])
+        low = numpy.clip(numpy.searchsorted(src, tgt, side="right") - 1, 0, len(src) - 2)
+        frac = (tgt - src[low]) / (src[low + 1] - src[low])
+        rows = numpy.repeat(numpy.arange(len(tgt)), 2)
+        cols = numpy.stack((low, low + 1), axis=1).ravel()
+        weights = numpy.stack((1 - frac, frac), axis=1).ravel()
+        return scipy.sparse.csr_matrix((weights, (rows, cols)), shape=(len(tgt), len(src)))
+
+    def apply(self, *fields):
+        # Regrid any number of fields on the source grid with a single sparse-times-dense product on the stacked fields
+        stacked = numpy.stack([numpy.asarray(field).reshape(-1) for field in fields], axis=1)
+        regridded = numpy.ascontiguousarray((self.__matrix @ stacked).T)
+        return [regridded[i].reshape(self.__tgt_shape) for i in range(len(fields))]
+
+    @staticmethod
+    def get(src_lon, src_lat, tgt_lon, tgt_lat, dtype=numpy.float64):
+        # Source and target grids never change during a run, so keep one Regridder per grid pair (and dtype)
+        key = tuple(numpy.asarray(axis, dtype=numpy.float64).tobytes() for axis in (src_lon, src_lat, tgt_lon, tgt_lat)) + (numpy.dtype(dtype).str,)
+        with regridder_cache_lock:
+            regridder = regridder_cache.get(key)
+        if regridder is None:
+            regridder = Regridder(src_lon, src_lat, tgt_lon, tgt_lat, dtype=dtype)
+            with regridder_cache_lock:
+                regridder = regridder_cache.setdefault(key, regridder)
+        return regridder
+
+
+regridder_cache = {}
+regridder_cache_lock = threading.Lock()
 
 
 class WindData:
     def __init__(self, date, wind_grid, u_velocity, v_velocity):
-        self.__u_velocity = numpy.array(u_velocity)
-        self.__v_velocity = numpy.array(v_velocity)
+        self.__u_velocity = numpy.asarray(u_velocity)
+        self.__v_velocity = numpy.asarray(v_velocity)
         self.__date = date
         self.__wind_grid = wind_grid
 
@@ -117,6 +213,10 @@ class WindData:
     def v_velocity(self):
         return self.__v_velocity
 
+    def astype(self, dtype):
+        # The same wind with U and V as dtype; no copy is made if they already are
+        return WindData(self.__date, self.__wind_grid, self.__u_velocity.astype(dtype, copy=False), self.__v_velocity.astype(dtype, copy=False))
+
 
 class Roughness:
     def __init__(self, lon, lat, land_rough):
@@ -133,20 +233,819 @@ class Roughness:
     def land_rough(self):
         return self.__land_rough
 
-    def get(filename):
+    def get(filename, window=None):
+        # window = (row_start, row_end, col_start, col_end) reads only that block of land_rough
+        lon, lat = Roughness.get_axes(filename, window)
+        f = netCDF4.Dataset(filename, 'r')
+        if window is None:
+            land_rough = numpy.array(f.variables["land_rough"][:][:])
+        else:
+            row_start, row_end, col_start, col_end = window
+            land_rough = numpy.array(f.variables["land_rough"][row_start:row_end, col_start:col_end])
+        f.close()
+        return lon, lat, land_rough
+
+    @staticmethod
+    def get_axes(filename, window=None):
+        # Just the lon and lat of the grid (or of a window of it), without reading land_rough
         f = netCDF4.Dataset(filename, 'r')
         lon = numpy.array(f.variables["lon"][:])
         lat = numpy.array(f.variables["lat"][:])
-        land_rough = numpy.array(f.variables["land_rough"][:][:])
         f.close()
-        return lon, lat, land_rough
+        if window is not None:
+            row_start, row_end, col_start, col_end = window
+            lon = lon[col_start:col_end]
+            lat = lat[row_start:row_end]
+        return lon, lat
+
+    @staticmethod
+    def bbox_window(filename, bbox):
+        # Rows and columns of the roughness grid inside (lon_min, lat_min, lon_max, lat_max)
+        lon_min, lat_min, lon_max, lat_max = bbox
+        f = netCDF4.Dataset(filename, 'r')
+        lon = numpy.array(f.variables["lon"][:])
+        lat = numpy.array(f.variables["lat"][:])
+        f.close()
+        window = (int(numpy.searchsorted(lat, lat_min, side="left")), int(numpy.searchsorted(lat, lat_max, side="right")),
+                  int(numpy.searchsorted(lon, lon_min, side="left")), int(numpy.searchsorted(lon, lon_max, side="right")))
+        if window[0] >= window[1] or window[2] >= window[3]:
+            raise RuntimeError("The bounding box does not contain any points of " + filename)
+        return window
+
+    @staticmethod
+    def mask_window(filename, mask_filename):
+        # A mask file has lat, lon and mask variables on a block of the roughness grid; points where mask is 0 are left out
+        # Returns the block's rows and columns and the boolean mask
+        f = netCDF4.Dataset(mask_filename, 'r')
+        mask_lon = numpy.array(f.variables["lon"][:])
+        mask_lat = numpy.array(f.variables["lat"][:])
+        mask = numpy.array(f.variables["mask"][:][:]) != 0
+        f.close()
+        window = Roughness.bbox_window(filename, (mask_lon[0], mask_lat[0], mask_lon[-1], mask_lat[-1]))
+        if (window[1] - window[0], window[3] - window[2]) != mask.shape:
+            raise RuntimeError("The grid of " + mask_filename + " is not a block of the grid of " + filename)
+        return window, mask
+
+
+class WindPlan:
+    # Time-invariant roughness fields and regridding operators on the wind grid; built once and shared by every time slice
+    # The roughness fields and operators are in the dtype of z0_wr's land_rough, which is the precision every time slice is calculated in
+    # With z0_wr_on_wind_grid, z0_wr is already on the wind grid (as for WND input) and is used as is rather than regridded
+    def __init__(self, sl, wind_grid, z0_wr, wback_grid=None, z0_wbackr=None, z0_wr_on_wind_grid=False):
+        self.__sl = sl
+        dtype = z0_wr.land_rough().dtype
+        self.__wind_grid = wind_grid
+        self.__wback_grid = wback_grid
+        if z0_wr_on_wind_grid:
+            self.__z0_wr_w_grid = z0_wr.land_rough()
+        else:
+            self.__z0_wr_w_grid = Regridder.get(z0_wr.lon(), z0_wr.lat(), wind_grid.lon1d(), wind_grid.lat1d(), dtype).apply(z0_wr.land_rough())[0]
+        self.__z0_wbackr_w_grid = None
+        self.__z0_wbackr_wback_grid = None
+        self.__wback_to_wind = None
+        if wback_grid is not None:
+            self.__wback_to_wind = Regridder.get(wback_grid.lon1d(), wback_grid.lat1d(), wind_grid.lon1d(), wind_grid.lat1d(), dtype)
+            if sl == "adcirc":
+                self.__z0_wbackr_w_grid = Regridder.get(z0_wbackr.lon(), z0_wbackr.lat(), wind_grid.lon1d(),
+                                                        wind_grid.lat1d(), dtype).apply(z0_wbackr.land_rough())[0]
+            elif sl == "up-down":
+                self.__z0_wbackr_wback_grid = Regridder.get(z0_wbackr.lon(), z0_wbackr.lat(), wback_grid.lon1d(),
+                                                            wback_grid.lat1d(), dtype).apply(z0_wbackr.land_rough())[0]
+
+    def sl(self):
+        return self.__sl
+
+    def wind_grid(self):
+        return self.__wind_grid
+
+    def wback_grid(self):
+        return self.__wback_grid
+
+    def z0_wr_w_grid(self):
+        return self.__z0_wr_w_grid
+
+    def z0_wbackr_w_grid(self):
+        return self.__z0_wbackr_w_grid
+
+    def z0_wbackr_wback_grid(self):
+        return self.__z0_wbackr_wback_grid
+
+    def wback_to_wind(self):
+        return self.__wback_to_wind
+
+
+class SubdomainPlan:
+    # Time-invariant roughness fields and regridding operators for one row subdomain of the high-res grid
+    # Scaled winds come out in the dtype of z0_hr's land_rough, whatever the dtype of the directional z0 cube
+    # static is (static_factor, mixed_points, mixed_z0_wr_hr_grid) as from static_plan() of a plan for the same subdomain, e.g. in shared memory;
+    # if None, it is planned here
+    def __init__(self, sl, z0_hr, wind_to_hr, z0_wr_hr_grid, z0_directional, static=None):
+        self.__sl = sl
+        self.__z0_hr = z0_hr
+        self.__dtype = z0_hr.land_rough().dtype
+        self.__angle = z0_directional.angle().astype(self.__dtype)  # So the sector interpolation weights are calculated in dtype too
+        self.__z0_hr_grid = WindGrid(z0_hr.lon(), z0_hr.lat())
+        self.__wind_to_hr = wind_to_hr
+        self.__z0_wr_hr_grid = z0_wr_hr_grid
+        self.__z0_directional = z0_directional
+        # Directional z0 is only ever evaluated at the high-res nodes, so if it was generated on the same grid, look it up directly
+        self.__z0_directional_lookup = z0_directional.on_grid(z0_hr.lon(), z0_hr.lat())
+        self.__z0_directional_values = None
+        if self.__z0_directional_lookup:
+            # The lookup gathers from the flattened cube; a longitude window of it is strided, so that is copied once here (rows are views)
+            self.__z0_directional_values = numpy.ascontiguousarray(z0_directional.values())
+        self.__z0_directional_interpolant = None
+        self.__static_factor = None
+        self.__mixed = None
+        self.__mixed_z0_wr_hr_grid = None
+        if static is not None:
+            self.__static_factor, self.__mixed, self.__mixed_z0_wr_hr_grid = static
+        elif self.__z0_directional_lookup:
+            self.__plan_static()
+
+    def __plan_static(self):
+        # Where directional z0 is the same in every sector (open water, mostly), direction does not matter, so the scaling reduces to a fixed
+        # factor per point; it is calculated here once, and only the remaining mixed land/water points go through the directional path
+        # Sectors count as the same if they agree to STATIC_Z0_RTOL, since the cone sums round differently in the last digits
+        # Below STATIC_MIN_FRACTION static points, gathering and scattering the mixed points costs more than it saves, so every point goes
+        # through the directional path
+        # The mixed points' directional z0 is gathered from the cube for each slice rather than copied, so a mapped or shared cube stays shared
+        values = self.__z0_directional_values
+        n_angle = values.shape[2]
+        z0_static = values[:, :, 0]
+        static = numpy.ones(z0_static.shape, dtype=bool)
+        for k in range(1, n_angle):
+            static &= numpy.abs(values[:, :, k] - z0_static) <= STATIC_Z0_RTOL * z0_static
+        if static.mean() < STATIC_MIN_FRACTION:
+            return
+        self.__mixed = numpy.flatnonzero(~static)
+        unit_wind = WindData(None, self.__z0_hr_grid, numpy.ones(z0_static.shape, self.__dtype), numpy.ones(z0_static.shape, self.__dtype))
+        if self.__sl == "adcirc":
+            self.__static_factor = adcirc_scaling(unit_wind, self.__z0_wr_hr_grid, z0_static).u_velocity()
+            self.__mixed_z0_wr_hr_grid = self.__z0_wr_hr_grid.reshape(-1)[self.__mixed]
+        elif self.__sl == "up-down":
+            self.__static_factor = zref_to_ten(z0_static, unit_wind).u_velocity()
+        self.__static_factor = self.__static_factor.astype(self.__dtype, copy=False)
+
+    @staticmethod
+    def create(wind_plan, z0_hr, z0_directional):
+        wind_grid = wind_plan.wind_grid()
+        # Each subdomain (and each streamed block) has its own target grid, so its operator is not kept in the Regridder cache
+        wind_to_hr = Regridder(wind_grid.lon1d(), wind_grid.lat1d(), z0_hr.lon(), z0_hr.lat(), dtype=z0_hr.land_rough().dtype)
+        z0_wr_hr_grid = None
+        if wind_plan.sl() == "adcirc":
+            z0_wr_hr_grid = wind_to_hr.apply(wind_plan.z0_wr_w_grid())[0]
+        return SubdomainPlan(wind_plan.sl(), z0_hr, wind_to_hr, z0_wr_hr_grid, z0_directional)
+
+    def sl(self):
+        return self.__sl
+
+    def z0_hr(self):
+        return self.__z0_hr
+
+    def z0_hr_grid(self):
+        return self.__z0_hr_grid
+
+    def wind_to_hr(self):
+        return self.__wind_to_hr
+
+    def z0_wr_hr_grid(self):
+        return self.__z0_wr_hr_grid
+
+    def z0_directional_source(self):
+        return self.__z0_directional
+
+    def static_factor(self):
+        # Scale factor of the direction-independent points, or None if every point goes through the directional path
+        return self.__static_factor
+
+    def mixed_points(self):
+        # Flat indices of the points whose z0 depends on direction
+        return self.__mixed
+
+    def static_plan(self):
+        # What a plan for the same subdomain needs to skip planning the static points: (static_factor, mixed_points, mixed_z0_wr_hr_grid)
+        return self.__static_factor, self.__mixed, self.__mixed_z0_wr_hr_grid
+
+    def mixed_z0_directional(self, direction):
+        return directional_z0_lookup(self.__z0_directional_values, self.__angle, direction, self.__mixed, self.__dtype)
+
+    def mixed_z0_wr_hr_grid(self):
+        return self.__mixed_z0_wr_hr_grid
+
+    def z0_directional(self, direction):
+        # Directional z0 at every point of the subdomain for the given (meteorological, math convention) wind direction
+        if self.__z0_directional_lookup:
+            return directional_z0_lookup(self.__z0_directional_values, self.__angle, direction).astype(self.__dtype, copy=False)
+        # Fall back to the general interpolant if it was generated on a different grid than the high-res roughness file
+        if self.__z0_directional_interpolant is None:
+            self.__z0_directional_interpolant = self.__z0_directional.interpolant()
+        return self.__z0_directional_interpolant((self.__z0_hr_grid.lat(), self.__z0_hr_grid.lon(), direction)).astype(self.__dtype, copy=False)
+
+
+class DirectionalZ0:
+    # Directional z0 for each cone center angle at every point of a lat/lon grid, as an (n_lat, n_lon, n_angle) cube
+    # Saved as <name>.npy, the raw cube, which is memory-mapped on load, and <name>.json, which holds the format version, the axes,
+    # sigma, radius and the SHA-256 of the high-res roughness file it was generated from
+    # Row subsets are views of the same cube, so subdomains never copy it
+    def __init__(self, lat, lon, angle, values, sigma=None, radius=None, source_sha256=None, name=None, window=None):
+        self.__lat = numpy.asarray(lat)
+        self.__lon = numpy.asarray(lon)
+        self.__angle = numpy.asarray(angle)
+        self.__values = values
+        self.__sigma = sigma
+        self.__radius = radius
+        self.__source_sha256 = source_sha256
+        self.__name = name  # Saved product the values are mapped from, if any
+        self.__window = window if window is not None else (0, len(self.__lat), 0, len(self.__lon))  # Rows and columns of the saved product
+
+    def lat(self):
+        return self.__lat
+
+    def lon(self):
+        return self.__lon
+
+    def angle(self):
+        return self.__angle
+
+    def values(self):
+        return self.__values
+
+    def sigma(self):
+        return self.__sigma
+
+    def radius(self):
+        return self.__radius
+
+    def source_sha256(self):
+        return self.__source_sha256
+
+    def name(self):
+        return self.__name
+
+    def window(self):
+        return self.__window
+
+    def on_grid(self, lon, lat):
+        return numpy.array_equal(self.__lat, lat) and numpy.array_equal(self.__lon, lon)
+
+    def subset(self, row_start, row_end, col_start=0, col_end=None):
+        col_end = len(self.__lon) if col_end is None else col_end
+        return DirectionalZ0(self.__lat[row_start:row_end], self.__lon[col_start:col_end], self.__angle, self.__values[row_start:row_end, col_start:col_end, :],
+                             self.__sigma, self.__radius, self.__source_sha256, self.__name,
+                             (self.__window[0] + row_start, self.__window[0] + row_end, self.__window[2] + col_start, self.__window[2] + col_end))
+
+    def restrict(self, lon, lat):
+        # View of just the given lon/lat grid, if it is a block of this one; otherwise all of it, to be interpolated
+        row_start = int(numpy.searchsorted(self.__lat, lat[0]))
+        col_start = int(numpy.searchsorted(self.__lon, lon[0]))
+        if numpy.array_equal(self.__lat[row_start:row_start + len(lat)], lat) and numpy.array_equal(self.__lon[col_start:col_start + len(lon)], lon):
+            return self.subset(row_start, row_start + len(lat), col_start, col_start + len(lon))
+        return self
+
+    def interpolant(self):
+        return scipy.interpolate.RegularGridInterpolator((self.__lat, self.__lon, self.__angle), self.__values, method='linear')
+
+    def __reduce__(self):
+        # A mapped cube is sent to other processes by name, and they map it themselves
+        if self.__name is not None:
+            return DirectionalZ0.load, (self.__name, self.__window)
+        return DirectionalZ0, (self.__lat, self.__lon, self.__angle, numpy.asarray(self.__values), self.__sigma, self.__radius, self.__source_sha256)
+
+    @staticmethod
+    def from_interpolant(interpolant, sigma=None, radius=None, source_sha256=None):
+        return DirectionalZ0(interpolant.grid[0], interpolant.grid[1], interpolant.grid[2], interpolant.values, sigma, radius, source_sha256)
+
+    def save(self, name, dtype=None):
+        # The metadata is written last, so a partially written product is never picked up by load
+        if os.path.exists(name + ".json"):
+            os.remove(name + ".json")
+        dtype = numpy.dtype(dtype if dtype is not None else self.__values.dtype)
+        tmp = "." + str(os.getpid()) + ".tmp"  # Runs sharing a cache directory may save the same product at once
+        values = numpy.lib.format.open_memmap(name + ".npy" + tmp, mode="w+", dtype=dtype, shape=self.__values.shape)
+        rows_per_block = max(1, 2**27 // max(1, self.__values[0].nbytes))  # Copy through a bounded amount of memory, even from a memory-mapped cube
+        for row_start in range(0, values.shape[0], rows_per_block):
+            values[row_start:row_start + rows_per_block] = self.__values[row_start:row_start + rows_per_block]
+        values.flush()
+        del values
+        os.replace(name + ".npy" + tmp, name + ".npy")
+        meta = {"format_version": DIRECTIONAL_Z0_FORMAT_VERSION, "dtype": dtype.str, "shape": list(self.__values.shape),
+                "lat": self.__lat.tolist(), "lon": self.__lon.tolist(), "angle": self.__angle.tolist(),
+                "sigma": self.__sigma, "radius": self.__radius, "source_sha256": self.__source_sha256}
+        with open(name + ".json" + tmp, "w") as file:
+            json.dump(meta, file)
+        os.replace(name + ".json" + tmp, name + ".json")
+
+    @staticmethod
+    def load(name, window=None):
+        if not os.path.exists(name + ".json"):
+            # Products saved before the memory-mapped format are pickled interpolants, and have to be read into memory
+            print("INFO: No " + name + ".json found, so loading the legacy pickled interpolant " + name + ".pickle", flush=True)
+            with open(name + ".pickle", "rb") as file:
+                z0_directional = DirectionalZ0.from_interpolant(pickle.load(file))
+            return z0_directional if window is None else z0_directional.subset(*window)
+        with open(name + ".json", "r") as file:
+            meta = json.load(file)
+        if meta["format_version"] != DIRECTIONAL_Z0_FORMAT_VERSION:
+            raise RuntimeError("Unsupported directional z0 format version " + str(meta["format_version"]) + " in " + name + ".json")
+        values = numpy.load(name + ".npy", mmap_mode="r")
+        if list(values.shape) != meta["shape"] or values.dtype.str != meta["dtype"]:
+            raise RuntimeError(name + ".npy does not match " + name + ".json")
+        z0_directional = DirectionalZ0(meta["lat"], meta["lon"], meta["angle"], values, meta["sigma"], meta["radius"], meta["source_sha256"], name)
+        return z0_directional if window is None else z0_directional.subset(*window)
+
+
+DIRECTIONAL_Z0_FORMAT_VERSION = 1
+
+
+def directional_z0_cache_key(hr_sha256, sigma, radius, dtype="float64"):
+    # Products are keyed by what they are generated from and how they are stored, so a changed roughness file, sigma/radius or storage dtype
+    # never matches a stale one
+    key = {"format_version": DIRECTIONAL_Z0_FORMAT_VERSION, "hr_sha256": hr_sha256, "sigma": sigma, "radius": radius, "dtype": numpy.dtype(dtype).name}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def evict_directional_z0_cache(cache_dir, max_bytes, keep):
+    # Remove least recently used products until the cache fits in max_bytes; a product's .json is touched every time it is used
+    entries = []
+    for filename in os.listdir(cache_dir):
+        if filename.endswith(".json"):
+            name = os.path.join(cache_dir, filename[:-len(".json")])
+            size = sum(os.path.getsize(name + ext) for ext in (".json", ".npy") if os.path.exists(name + ext))
+            entries.append((os.path.getmtime(name + ".json"), name, size))
+    total = sum(entry[2] for entry in entries)
+    for _, name, size in sorted(entries):
+        if total <= max_bytes:
+            break
+        if name == keep:
+            continue
+        print("INFO: Evicting directional z0 " + name + " from the cache", flush=True)
+        os.remove(name + ".json")
+        if os.path.exists(name + ".npy"):
+            os.remove(name + ".npy")
+        total -= size
+
+
+STATIC_Z0_RTOL = 1e-9
+STATIC_MIN_FRACTION = 0.25  # On a 600x800 subdomain, the fast path broke even at about 20% static points
+
+
+def file_sha256(filename, cache_dir):
+    # The digest is saved in cache_dir with the file's size and modification time, so an unchanged file is only read once; nothing is
+    # written next to the file itself. The saved digest is named after the file and a hash of its absolute path
+    stat = os.stat(filename)
+    path = os.path.abspath(filename)
+    digest_name = os.path.join(cache_dir, os.path.basename(filename) + "-" + hashlib.sha256(path.encode()).hexdigest()[:16] + ".sha256")
+    try:
+        with open(digest_name, "r") as file:
+            saved = json.load(file)
+        if saved["path"] == path and saved["size"] == stat.st_size and saved["mtime_ns"] == stat.st_mtime_ns:
+            return saved["sha256"]
+    except (OSError, ValueError, KeyError):
+        pass
+    sha256 = hashlib.sha256()
+    with open(filename, "rb") as file:
+        for block in iter(lambda: file.read(2**24), b""):
+            sha256.update(block)
+    try:
+        with open(digest_name, "w") as file:
+            json.dump({"path": path, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "sha256": sha256.hexdigest()}, file)
+    except OSError:
+        pass  # e.g. a read-only directory; the digest is then recomputed every run
+    return sha256.hexdigest()
+
+
+class SharedArray:
+    # NumPy array backed by multiprocessing.shared_memory; worker processes attach to it by name instead of receiving a pickled copy
+    def __init__(self, shape, dtype, name=None):
+        self.__shape = tuple(shape)
+        self.__dtype = numpy.dtype(dtype)
+        size = max(1, int(numpy.prod(self.__shape)) * self.__dtype.itemsize)
+        self.__owner = name is None
+        self.__shm = multiprocessing.shared_memory.SharedMemory(name=name, create=self.__owner, size=size if self.__owner else 0)
+        self.__array = numpy.ndarray(self.__shape, dtype=self.__dtype, buffer=self.__shm.buf)
+
+    def array(self):
+        return self.__array
+
+    def spec(self):
+        return self.__shm.name, self.__shape, self.__dtype.str
+
+    @staticmethod
+    def from_array(array):
+        shared = SharedArray(array.shape, array.dtype)
+        shared.array()[...] = array
+        return shared
+
+    @staticmethod
+    def attach(spec):
+        name, shape, dtype = spec
+        return SharedArray(shape, dtype, name)
+
+    def close(self):
+        self.__array = None
+        self.__shm.close()
+        if self.__owner:
+            self.__shm.unlink()
+
+
+class SubdomainProcessPool:
+    # Runs roughness_adjust for each subdomain on a pool of worker processes, sidestepping the GIL
+    # The static high-res roughness, the directional z0 cube, the regridding operators and the static-point plan are copied into shared
+    # memory once; per slice, only the wind-grid WindData goes to the workers, and they write their scaled U and V rows into shared output buffers
+    def __init__(self, subd_plan, subd_start_index, subd_end_index, hr_shape, workers, slots=1):
+        self.__subd_start_index = subd_start_index
+        self.__subd_end_index = subd_end_index
+        self.__shared = []
+        # One output slot per time slice that may be in flight at once, in the precision the plans calculate in
+        dtype = subd_plan[0].z0_hr().land_rough().dtype
+        self.__u_out = SharedArray((slots,) + tuple(hr_shape), dtype)
+        self.__v_out = SharedArray((slots,) + tuple(hr_shape), dtype)
+        worker_plans = []
+        for i, plan in enumerate(subd_plan):
+            matrix = plan.wind_to_hr().matrix()
+            worker_plans.append({"sl": plan.sl(), "lon": plan.z0_hr().lon(), "lat": plan.z0_hr().lat(), "rows": (subd_start_index[i], subd_end_index[i]),
+                                 "land_rough": self.__share(plan.z0_hr().land_rough()),
+                                 "z0_wr_hr_grid": self.__share(plan.z0_wr_hr_grid()) if plan.z0_wr_hr_grid() is not None else None,
+                                 "z0_directional": self.__share_directional_z0(plan.z0_directional_source()),
+                                 "static": tuple(self.__share(array) if array is not None else None for array in plan.static_plan()),
+                                 "wind_to_hr": (plan.wind_to_hr().src_shape(), plan.wind_to_hr().tgt_shape(), matrix.shape, self.__share(matrix.data),
+                                                self.__share(matrix.indices), self.__share(matrix.indptr))})
+        self.__executor = concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=process_worker_init,
+                                                                 initargs=(worker_plans, self.__u_out.spec(), self.__v_out.spec(), profiler is not None))
+
+    def __share(self, array):
+        shared = SharedArray.from_array(numpy.asarray(array))
+        self.__shared.append(shared)
+        return shared.spec()
+
+    def __share_directional_z0(self, z0_directional):
+        # A memory-mapped cube is already shared through the page cache, so the workers just map the same file
+        # unless it is a longitude window, which each worker would have to copy to make contiguous
+        if z0_directional.name() is not None and z0_directional.values().flags.c_contiguous:
+            return z0_directional, None
+        return DirectionalZ0(z0_directional.lat(), z0_directional.lon(), z0_directional.angle(), None), self.__share(z0_directional.values())
+
+    def submit(self, wind_w_grid, slot=0, time_index=None):
+        # Returns one future that resolves to (u_scaled, v_scaled, date) once every subdomain has written its rows to the output slot
+        task = concurrent.futures.Future()
+        futures = [self.__executor.submit(process_worker_run, [i, slot, wind_w_grid, time_index]) for i in range(len(self.__subd_start_index))]
+        remaining = [len(futures)]
+        lock = threading.Lock()
+
+        def subdomain_done(future):
+            if profiler is not None and future.exception() is None:
+                profiler.extend(future.result())  # The worker's profiler records
+            with lock:
+                remaining[0] -= 1
+                if remaining[0] > 0:
+                    return
+            errors = [f.exception() for f in futures if f.exception() is not None]
+            if errors:
+                task.set_exception(errors[0])
+            else:
+                # Copy so the slot can be reused while this slice is written
+                task.set_result((self.__u_out.array()[slot].copy(), self.__v_out.array()[slot].copy(), wind_w_grid.date()))
+
+        for future in futures:
+            future.add_done_callback(subdomain_done)
+        return task
+
+    def map(self, wind_w_grid, time_index=None):
+        return self.submit(wind_w_grid, 0, time_index).result()
+
+    def close(self):
+        self.__executor.shutdown()
+        for shared in self.__shared + [self.__u_out, self.__v_out]:
+            shared.close()
+
+
+process_worker_state = None
+
+
+def process_worker_init(worker_plans, u_out_spec, v_out_spec, profile=False):
+    # Attach to the shared output buffers once per worker process; a subdomain's plan is rebuilt around its shared arrays the first time
+    # the worker is given that subdomain, so a worker only attaches to what it scales
+    # With profile, the worker keeps its own profiler, whose records go back to the main process with each result
+    global process_worker_state, profiler
+    profiler = Profiler() if profile else None
+    u_out = SharedArray.attach(u_out_spec)
+    v_out = SharedArray.attach(v_out_spec)
+    process_worker_state = (worker_plans, {}, u_out.array(), v_out.array(), [u_out, v_out])
+
+
+def process_worker_plan(i):
+    worker_plans, subd_plan, _, _, attached = process_worker_state
+    if i in subd_plan:
+        return subd_plan[i]
+
+    def attach(spec):
+        if spec is None:
+            return None
+        shared = SharedArray.attach(spec)
+        attached.append(shared)
+        return shared.array()
+
+    worker_plan = worker_plans[i]
+    src_shape, tgt_shape, matrix_shape, data, indices, indptr = worker_plan["wind_to_hr"]
+    matrix = scipy.sparse.csr_matrix((attach(data), attach(indices), attach(indptr)), shape=matrix_shape, copy=False)
+    wind_to_hr = Regridder(None, None, None, None, src_shape, tgt_shape, matrix)
+    z0_hr = Roughness(worker_plan["lon"], worker_plan["lat"], attach(worker_plan["land_rough"]))
+    z0_directional, z0_directional_values = worker_plan["z0_directional"]
+    if z0_directional_values is not None:
+        z0_directional = DirectionalZ0(z0_directional.lat(), z0_directional.lon(), z0_directional.angle(), attach(z0_directional_values))
+    static = tuple(attach(spec) for spec in worker_plan["static"])
+    subd_plan[i] = (worker_plan["rows"], SubdomainPlan(worker_plan["sl"], z0_hr, wind_to_hr, attach(worker_plan["z0_wr_hr_grid"]), z0_directional, static))
+    return subd_plan[i]
+
+
+def process_worker_run(worker_inputs):
+    i, slot, wind_w_grid, time_index = worker_inputs
+    _, _, u_out, v_out, _ = process_worker_state
+    (row_start, row_end), plan = process_worker_plan(i)
+    subd_wind_scaled = roughness_adjust([wind_w_grid, plan, (time_index, i)])
+    u_out[slot, row_start:row_end, :] = subd_wind_scaled.u_velocity()
+    v_out[slot, row_start:row_end, :] = subd_wind_scaled.v_velocity()
+    return profiler.drain() if profiler is not None else None
+
+
+class TimeSliceScheduler:
+    # Keeps up to max_in_flight whole-domain time slices in progress and hands finished slices back in time order
+    # Slices that finish early wait in a reorder buffer; they still count against max_in_flight until they are handed back
+    def __init__(self, max_in_flight):
+        self.__max_in_flight = max_in_flight
+        self.__in_flight = {}
+        self.__reorder_buffer = {}
+        self.__next_index = 0
+
+    def submit(self, time_index, future):
+        self.__in_flight[time_index] = future
+
+    def ready(self, drain=False):
+        # Yield (time_index, (u_scaled, v_scaled, date)) in time order; block while the cap is reached, or until everything is done if drain
+        while True:
+            for time_index in [i for i, future in self.__in_flight.items() if future.done()]:
+                self.__reorder_buffer[time_index] = self.__in_flight.pop(time_index).result()  # Re-raises any task exception
+            while self.__next_index in self.__reorder_buffer:
+                yield self.__next_index, self.__reorder_buffer.pop(self.__next_index)
+                self.__next_index += 1
+            outstanding = len(self.__in_flight) + len(self.__reorder_buffer)
+            if outstanding == 0 or (not drain and outstanding < self.__max_in_flight):
+                return
+            concurrent.futures.wait(list(self.__in_flight.values()), return_when=concurrent.futures.FIRST_COMPLETED)
+
+
+class WindScaler:
+    # In-process entry point: scales wind on its own grid to the high-res roughness grid, one time slice at a time, without any files
+    # Built once from the high-res roughness and its directional z0; everything that does not change with time is planned here,
+    # so scale() and stream() only do the per-slice work. main() is a thin wrapper that reads files into stream() and writes what it yields
+    # Every slice is calculated in the dtype of z0_hr's land_rough, and input winds are converted to it
+    # Blending with a background wind needs blend_inputs, as from generate_ctr_interpolant and generate_rmw_interpolant, and a wind_plan
+    # built with the background wind grid and roughness
+    def __init__(self, wind_plan, z0_hr, z0_directional, blend_inputs=None, threads=1, pool="thread", tslices=0):
+        self.__wind_plan = wind_plan
+        self.__blend_inputs = blend_inputs
+        self.__dtype = z0_hr.land_rough().dtype
+        self.__hr_grid = WindGrid(z0_hr.lon(), z0_hr.lat())
+        self.__hr_shape = z0_hr.land_rough().shape
+        self.__tslices = tslices
+        # When scheduling by time slice, each slice is one whole-domain task, so there is a single subdomain
+        subdomains = 1 if tslices > 0 else threads
+        self.__subd_plan, self.__subd_start_index, self.__subd_end_index = subd_prep(z0_hr, z0_directional, wind_plan, subdomains)
+        self.__executor = None
+        self.__process_pool = None
+        if pool == "process":
+            # The plans now live in shared memory, so drop this process's copies
+            self.__process_pool = SubdomainProcessPool(self.__subd_plan, self.__subd_start_index, self.__subd_end_index, self.__hr_shape, threads,
+                                                       max(1, tslices))
+            self.__subd_plan = None
+        else:
+            self.__executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+
+    @staticmethod
+    def create(sl, wind_grid, z0_wr, z0_hr, z0_directional, wback_grid=None, z0_wbackr=None, blend_inputs=None, threads=1, pool="thread",
+               tslices=0, z0_wr_on_wind_grid=None):
+        # From the roughness arrays alone, planning the wind grid as well; wind and background roughness are converted to z0_hr's dtype
+        # z0_wr_on_wind_grid is passed to WindPlan; if None, it is whether z0_wr has the same coordinates as the wind grid
+        dtype = z0_hr.land_rough().dtype
+        z0_wr = Roughness(z0_wr.lon(), z0_wr.lat(), numpy.asarray(z0_wr.land_rough()).astype(dtype, copy=False))
+        if z0_wbackr is not None:
+            z0_wbackr = Roughness(z0_wbackr.lon(), z0_wbackr.lat(), numpy.asarray(z0_wbackr.land_rough()).astype(dtype, copy=False))
+        if z0_wr_on_wind_grid is None:
+            z0_wr_on_wind_grid = numpy.array_equal(z0_wr.lon(), wind_grid.lon1d()) and numpy.array_equal(z0_wr.lat(), wind_grid.lat1d())
+        wind_plan = WindPlan(sl, wind_grid, z0_wr, wback_grid, z0_wbackr, z0_wr_on_wind_grid)
+        return WindScaler(wind_plan, z0_hr, z0_directional, blend_inputs, threads, pool, tslices)
+
+    def hr_grid(self):
+        return self.__hr_grid
+
+    def dtype(self):
+        return self.__dtype
+
+    def scale(self, wind, wback=None, time_index=None):
+        # One time slice: wind, and the background wind wback if blending, to a WindData on the high-res grid
+        # time_index only labels the slice in the profile
+        wind_w_grid = self.__wind_adjust(wind, wback, time_index)
+        stage_start = profile_start()
+        if self.__process_pool is not None:
+            u_scaled, v_scaled, date = self.__process_pool.map(wind_w_grid, time_index)
+            if profiler is not None:
+                profiler.record("roughness_adjust", stage_start, time_index, None, u_scaled.size)
+        else:
+            subd_inputs = [[wind_w_grid, plan, (time_index, i)] for i, plan in enumerate(self.__subd_plan)]
+            subd_wind_scaled = list(self.__executor.map(roughness_adjust, subd_inputs))
+            if profiler is not None:
+                profiler.record("roughness_adjust", stage_start, time_index, None, self.__hr_shape[0] * self.__hr_shape[1])
+                stage_start = profile_start()
+            u_scaled, v_scaled, date = subd_restitch_domain(subd_wind_scaled, self.__subd_start_index, self.__subd_end_index, self.__hr_shape,
+                                                             len(subd_inputs), self.__dtype)
+            if profiler is not None:
+                profiler.record("restitch", stage_start, time_index, None, u_scaled.size)
+        return WindData(date, self.__hr_grid, u_scaled, v_scaled)
+
+    def stream(self, winds, wbacks=None):
+        # Scale an iterable of WindData lazily, yielding each scaled slice in order; wbacks, if blending, is an iterable of the matching
+        # background winds. Each input is only read when it is needed, so a generator that reads slices from disk is consumed as it goes
+        # With tslices, up to tslices slices are scaled at once, so that many may have been read ahead of what has been yielded
+        pairs = zip(winds, wbacks if wbacks is not None else itertools.repeat(None))
+        if self.__tslices == 0:
+            for time_index, (wind, wback) in enumerate(pairs):
+                yield self.scale(wind, wback, time_index)
+            return
+        scheduler = TimeSliceScheduler(self.__tslices)
+        for time_index, (wind, wback) in enumerate(pairs):
+            wind_w_grid = self.__wind_adjust(wind, wback, time_index)
+            if self.__process_pool is not None:
+                scheduler.submit(time_index, self.__process_pool.submit(wind_w_grid, time_index % self.__tslices, time_index))
+            else:
+                scheduler.submit(time_index, self.__executor.submit(roughness_adjust_domain, [wind_w_grid, self.__subd_plan[0], (time_index, 0)]))
+            for _, (u_scaled, v_scaled, date) in scheduler.ready():
+                yield WindData(date, self.__hr_grid, u_scaled, v_scaled)
+        for _, (u_scaled, v_scaled, date) in scheduler.ready(drain=True):
+            yield WindData(date, self.__hr_grid, u_scaled, v_scaled)
+
+    def close(self):
+        if self.__process_pool is not None:
+            self.__process_pool.close()
+        if self.__executor is not None:
+            self.__executor.shutdown()
+
+    def __wind_adjust(self, wind, wback, time_index):
+        if wback is not None and (self.__blend_inputs is None or self.__wind_plan.wback_grid() is None):
+            raise RuntimeError("Blending needs blend_inputs and a wind plan with the background wind grid")
+        stage_start = profile_start()
+        wind_w_grid = wind_adjust(wind.astype(self.__dtype), wback.astype(self.__dtype) if wback is not None else None, self.__wind_plan,
+                                  self.__blend_inputs)
+        if profiler is not None:
+            profiler.record("wind_adjust", stage_start, time_index, None, wind_w_grid.u_velocity().size)
+        return wind_w_grid
+
+
+class Profiler:
+    # Wall time and memory of each stage of a run, per time slice and per subdomain, for finding where a slow run spends its time
+    # Stages record themselves through the module-level profiler, which is None unless profiling is on, so a disabled profiler costs a
+    # profile_start call and a None check per stage
+    # Memory is the recording process's peak resident set size over the stage. On Linux the kernel's high-water mark (VmHWM) is reset
+    # at every stage start and read at every start and end, and each reading goes to all stages in progress; where it cannot be reset,
+    # a background thread samples the resident set size instead, and where that cannot be read either, the peak is unavailable (None)
+    # The peak is process-wide, so stages running at the same time on other threads of the process count towards each other's peak
+    def __init__(self):
+        self.__start = time.perf_counter()
+        self.__records = []
+        self.__lock = threading.Lock()
+        self.__open = []  # [start time, peak bytes] of each stage in progress
+        self.__hwm = Profiler.__reset_hwm()
+        if not self.__hwm and Profiler.rss() is not None:
+            threading.Thread(target=self.__sample, name="profiler-sampler", daemon=True).start()
+
+    def start(self):
+        with self.__lock:
+            self.__fold()
+            rss = Profiler.rss()
+            start = [time.perf_counter(), rss]
+            self.__open.append(start)
+            if self.__hwm:
+                Profiler.__reset_hwm()
+        return start
+
+    def record(self, stage, start, time_index=None, subdomain=None, points=None):
+        # start is the profile_start() of the stage; its time is comparable across processes on the same machine
+        end = time.perf_counter()
+        worker = threading.current_thread().name if multiprocessing.parent_process() is None else "process-" + str(os.getpid())
+        with self.__lock:
+            self.__fold()
+            self.__open = [stage_start for stage_start in self.__open if stage_start is not start]
+            self.__records.append((stage, time_index, subdomain, worker, start[0], end - start[0], points, start[1]))
+
+    def __fold(self):
+        # The peak since the last reading goes to every stage in progress; they all started before the last reset
+        peak = Profiler.__read_hwm() if self.__hwm else Profiler.rss()
+        if peak is not None:
+            for start in self.__open:
+                start[1] = max(start[1], peak)
+
+    def __sample(self):
+        while True:
+            time.sleep(PROFILE_SAMPLE_SECONDS)
+            with self.__lock:
+                self.__fold()
+
+    @staticmethod
+    def __reset_hwm():
+        # Whether the kernel's high-water mark of the resident set size could be reset to the current size (Linux 4.0 and later)
+        try:
+            with open("/proc/self/clear_refs", "w") as file:
+                file.write("5")
+            return Profiler.__read_hwm() is not None
+        except OSError:
+            return False
+
+    @staticmethod
+    def __read_hwm():
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+        return None
+
+    @staticmethod
+    def rss():
+        # Current resident set size in bytes, or None outside Linux
+        try:
+            with open("/proc/self/statm", "r") as file:
+                return int(file.read().split()[1]) * resource.getpagesize()
+        except OSError:
+            return None
+
+    @staticmethod
+    def max_rss():
+        # Peak resident set size of the process over its lifetime in bytes; getrusage reports it in bytes on macOS and in kB elsewhere
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+    def drain(self):
+        # Hand over and forget the records so far, e.g. to send them from a worker process to the main one
+        with self.__lock:
+            records, self.__records = self.__records, []
+        return records
+
+    def extend(self, records):
+        with self.__lock:
+            self.__records.extend(records)
+
+    def report(self, name, num_times, num_points):
+        # Writes every record to <name>.csv, and a summary by stage, worker and time slice plus the throughput of the whole run to <name>.json
+        # num_points is the number of high-res points in one time slice
+        seconds = time.perf_counter() - self.__start
+        records = [dict(zip(PROFILE_FIELDS, record)) for record in self.drain()]
+        for record in records:
+            record["start"] -= self.__start
+            record["peak_rss_mb"] = record["peak_rss_mb"] / 2**20 if record["peak_rss_mb"] is not None else None
+        frame = pandas.DataFrame(records, columns=PROFILE_FIELDS)
+        frame.to_csv(name + ".csv", index=False)
+
+        def summarize(key):
+            summary = {}
+            for value, group in frame.groupby(key, sort=True):
+                summary[str(value)] = {"count": int(len(group)), "seconds": float(group["seconds"].sum()), "mean_seconds": float(group["seconds"].mean()),
+                                       "max_seconds": float(group["seconds"].max()),
+                                       "peak_rss_mb": float(group["peak_rss_mb"].max()) if group["peak_rss_mb"].notna().any() else None}
+            return summary
+
+        slices = frame[frame["stage"] == "slice"]
+        report = {"seconds": seconds, "num_times": num_times, "num_points": num_points,
+                  "slices_per_second": num_times / seconds, "points_per_second": num_times * num_points / seconds,
+                  "peak_rss_mb": Profiler.max_rss() / 2**20,  # Of the main process over the whole run
+                  "stages": summarize("stage"), "workers": summarize("worker"),
+                  "slices": {str(int(time_index)): float(group["seconds"].sum()) for time_index, group in slices.groupby("time_index")}}
+        with open(name + ".json", "w") as file:
+            json.dump(report, file, indent=2)
+        return report
+
+
+PROFILE_FIELDS = ("stage", "time_index", "subdomain", "worker", "start", "seconds", "points", "peak_rss_mb")
+PROFILE_SAMPLE_SECONDS = 0.01  # Resident set size sampling interval where the kernel's high-water mark cannot be reset
+profiler = None  # Set to a Profiler by main (and in each worker process) when profiling
+
+
+def profile_start():
+    # The start of a stage for Profiler.record, or None when not profiling
+    return profiler.start() if profiler is not None else None
 
 
 class NetcdfOutput:
-    def __init__(self, filename, lon, lat):
+    # chunks is the (time, latitude, longitude) chunk shape of spd and dir, or None for the netCDF4 default
+    # complevel 0 disables compression; packed stores spd and dir as int16 with scale_factor/add_offset (0.01 m/s and 0.01 degree steps)
+    # uv adds the U10 and V10 components, with the same chunking, compression and packing
+    # append can write a block of rows starting at row_start instead of a whole time slice; the time is written with every block
+    def __init__(self, filename, lon, lat, chunks=None, complevel=2, shuffle=True, packed=False, uv=False):
         self.__filename = filename
         self.__lon = lon
         self.__lat = lat
+        self.__packed = packed
+        self.__uv = uv
+        self.__spd = None  # Reused for every time slice
+        self.__dir = None
         self.__nc = netCDF4.Dataset(self.__filename + ".nc", "w")
         self.__nc.group_order = "Main"
         self.__nc.source = "scale_and_subset.py"
@@ -171,14 +1070,29 @@ class NetcdfOutput:
                                                                      fill_value=netCDF4.default_fillvals["f8"])
         self.__group_main_var_lat = self.__group_main.createVariable("lat", "f8", "latitude", zlib=True, complevel=2,
                                                                      fill_value=netCDF4.default_fillvals["f8"])
-        # self.__group_main_var_u10       = self.__group_main.createVariable("U10", "f4", ("time", "latitude", "longitude"), zlib=True,
-        #                                                                     complevel=2,fill_value=netCDF4.default_fillvals["f4"])
-        # self.__group_main_var_v10       = self.__group_main.createVariable("V10", "f4", ("time", "latitude", "longitude"), zlib=True,
-        #                                                                     complevel=2,fill_value=netCDF4.default_fillvals["f4"])
-        self.__group_main_var_spd = self.__group_main.createVariable("spd", "f4", ("time", "latitude", "longitude"), zlib=True,
-                                                                     complevel=2, fill_value=netCDF4.default_fillvals["f4"])
-        self.__group_main_var_dir = self.__group_main.createVariable("dir", "f4", ("time", "latitude", "longitude"), zlib=True,
-                                                                     complevel=2, fill_value=netCDF4.default_fillvals["f4"])
+        if chunks is not None:
+            chunks = (chunks[0], min(chunks[1], len(self.__lat)), min(chunks[2], len(self.__lon)))
+        var_type = "i2" if self.__packed else "f4"
+        if self.__uv:
+            self.__group_main_var_u10 = self.__group_main.createVariable("U10", var_type, ("time", "latitude", "longitude"), zlib=complevel > 0,
+                                                                         complevel=max(complevel, 1), shuffle=shuffle, chunksizes=chunks,
+                                                                         fill_value=netCDF4.default_fillvals[var_type])
+            self.__group_main_var_v10 = self.__group_main.createVariable("V10", var_type, ("time", "latitude", "longitude"), zlib=complevel > 0,
+                                                                         complevel=max(complevel, 1), shuffle=shuffle, chunksizes=chunks,
+                                                                         fill_value=netCDF4.default_fillvals[var_type])
+        self.__group_main_var_spd = self.__group_main.createVariable("spd", var_type, ("time", "latitude", "longitude"), zlib=complevel > 0,
+                                                                     complevel=max(complevel, 1), shuffle=shuffle, chunksizes=chunks,
+                                                                     fill_value=netCDF4.default_fillvals[var_type])
+        self.__group_main_var_dir = self.__group_main.createVariable("dir", var_type, ("time", "latitude", "longitude"), zlib=complevel > 0,
+                                                                     complevel=max(complevel, 1), shuffle=shuffle, chunksizes=chunks,
+                                                                     fill_value=netCDF4.default_fillvals[var_type])
+        if self.__packed:
+            # netCDF4 packs and unpacks automatically
+            self.__group_main_var_spd.scale_factor, self.__group_main_var_spd.add_offset = PACKED_SCALE_OFFSET["spd"]
+            self.__group_main_var_dir.scale_factor, self.__group_main_var_dir.add_offset = PACKED_SCALE_OFFSET["dir"]
+            if self.__uv:
+                self.__group_main_var_u10.scale_factor, self.__group_main_var_u10.add_offset = PACKED_SCALE_OFFSET["U10"]
+                self.__group_main_var_v10.scale_factor, self.__group_main_var_v10.add_offset = PACKED_SCALE_OFFSET["V10"]
 
         # Add attributes to variables
         self.__base_date = datetime.datetime(1990, 1, 1, 0, 0, 0)
@@ -201,11 +1115,12 @@ class NetcdfOutput:
         self.__group_main_var_lat.standard_name = "latitude"
         self.__group_main_var_lat.axis = "y"
 
-        # self.__group_main_var_u10.units = "m s-1"
-        # self.__group_main_var_u10.coordinates = "time lat lon"
+        if self.__uv:
+            self.__group_main_var_u10.units = "m s-1"
+            self.__group_main_var_u10.coordinates = "time lat lon"
 
-        # self.__group_main_var_v10.units = "m s-1"
-        # self.__group_main_var_v10.coordinates = "time lat lon"
+            self.__group_main_var_v10.units = "m s-1"
+            self.__group_main_var_v10.coordinates = "time lat lon"
 
         self.__group_main_var_spd.units = "m s-1"
         self.__group_main_var_spd.coordinates = "time lat lon"
@@ -216,10 +1131,27 @@ class NetcdfOutput:
         self.__group_main_var_lat[:] = self.__lat
         self.__group_main_var_lon[:] = self.__lon
 
-    def append(self, idx, date, uvel, vvel, lock):
+    def append(self, idx, date, uvel, vvel, lock, row_start=0):
         if lock:
             lock.acquire()
+        if self.__spd is None or self.__spd.shape != uvel.shape or self.__spd.dtype != uvel.dtype:
+            self.__spd = numpy.empty(uvel.shape, uvel.dtype)
+            self.__dir = numpy.empty(uvel.shape, uvel.dtype)
+        spd_dir_from_uv(uvel, vvel, self.__spd, self.__dir)
+        self.__write(idx, date, uvel, vvel, self.__spd, self.__dir, row_start)
+        if lock:
+            lock.release()
 
+    def append_spd_dir(self, idx, date, spd, direction, lock):
+        if self.__uv:
+            raise RuntimeError("U10 and V10 cannot be written from speed and direction")
+        if lock:
+            lock.acquire()
+        self.__write(idx, date, None, None, spd, direction)
+        if lock:
+            lock.release()
+
+    def __write(self, idx, date, uvel, vvel, spd, direction, row_start=0):
         delta = (date - self.__base_date)
         minutes = round((delta.days * 86400 + delta.seconds) / 60)
         delta_unix = (date - self.__base_date_unix)
@@ -227,18 +1159,217 @@ class NetcdfOutput:
 
         self.__group_main_var_time[idx] = minutes
         self.__group_main_var_time_unix[idx] = seconds
-        # self.__group_main_var_u10[idx, :, :] = uvel
-        # self.__group_main_var_v10[idx, :, :] = vvel
-        self.__group_main_var_spd[idx, :, :] = magnitude_from_uv(uvel, vvel)
-        self.__group_main_var_dir[idx, :, :] = dir_met_to_and_from_math(direction_from_uv(uvel, vvel))
+        if self.__packed:
+            # NaN has no int16 representation, so points without a value are stored as the fill value instead
+            # The NaNs are replaced before netCDF4 packs the data, as casting them to int16 is undefined
+            spd, direction = self.__mask_nan(spd), self.__mask_nan(direction)
+            if self.__uv:
+                uvel, vvel = self.__mask_nan(uvel), self.__mask_nan(vvel)
+        rows = slice(row_start, row_start + spd.shape[0])
+        if self.__uv:
+            self.__group_main_var_u10[idx, rows, :] = uvel
+            self.__group_main_var_v10[idx, rows, :] = vvel
+        self.__group_main_var_spd[idx, rows, :] = spd
+        self.__group_main_var_dir[idx, rows, :] = direction
 
-        if lock:
-            lock.release()
+    @staticmethod
+    def __mask_nan(values):
+        nan = numpy.isnan(values)
+        return numpy.ma.masked_array(numpy.where(nan, 0, values), mask=nan)
 
     def close(self):
         self.__nc.close()
 
 
+# int16 packing of spd and dir as (scale_factor, add_offset); the valid packed values are -32766 to 32767, as -32767 is the int16 fill value
+# The speed offset puts 0 m/s at -32766, the lowest valid value, so calm points are not read back as missing; speeds go up to 655.33 m/s
+PACKED_SCALE_OFFSET = {"spd": (0.01, 327.66), "dir": (0.01, 180.0), "U10": (0.01, 0.0), "V10": (0.01, 0.0)}
+
+
+class ChunkedOutput:
+    # Zarr-like alternative to NetcdfOutput: spd and dir are stored in <filename>.chunks as one independently compressed file per
+    # (time, latitude block, longitude block) chunk, plus JSON metadata
+    # Every chunk belongs to a single time slice and is its own file, so different time slices can be appended at the same time without a lock
+    # chunked_to_netcdf.py converts the directory to the file NetcdfOutput would have written
+    def __init__(self, filename, lon, lat, chunks=None, complevel=2, shuffle=True, packed=False):
+        self.__dirname = filename + ".chunks"
+        self.__lon = numpy.asarray(lon)
+        self.__lat = numpy.asarray(lat)
+        self.__chunks = (512, 512) if chunks is None else (min(chunks[1], len(self.__lat)), min(chunks[2], len(self.__lon)))
+        self.__complevel = complevel
+        self.__shuffle = shuffle
+        self.__packed = packed
+        self.__dtype = numpy.dtype("<i2" if packed else "<f4")
+        shutil.rmtree(self.__dirname, ignore_errors=True)
+        for name in ("time", "spd", "dir"):
+            os.makedirs(os.path.join(self.__dirname, name))
+        meta = {"format_version": 1, "lon": self.__lon.tolist(), "lat": self.__lat.tolist(), "chunks": list(self.__chunks), "dtype": self.__dtype.str,
+                "complevel": complevel, "shuffle": shuffle, "packed": PACKED_SCALE_OFFSET if packed else None,
+                "fill_value": netCDF4.default_fillvals["i2" if packed else "f4"]}
+        with open(os.path.join(self.__dirname, "meta.json"), "w") as file:
+            json.dump(meta, file)
+
+    def append(self, idx, date, uvel, vvel, lock, row_start=0):
+        # lock is only taken for compatibility with NetcdfOutput.append; no two calls write the same file
+        if row_start != 0 or uvel.shape != (len(self.__lat), len(self.__lon)):
+            raise RuntimeError("ChunkedOutput can only append whole time slices")
+        spd, direction = spd_dir_from_uv(uvel, vvel)
+        for name, values in (("spd", spd), ("dir", direction)):
+            if self.__packed:
+                scale_factor, add_offset = PACKED_SCALE_OFFSET[name]
+                nan = numpy.isnan(values)
+                values = numpy.round((values - add_offset) / scale_factor)
+                values[nan] = netCDF4.default_fillvals["i2"]
+            values = values.astype(self.__dtype)
+            for i in range(0, len(self.__lat), self.__chunks[0]):
+                for j in range(0, len(self.__lon), self.__chunks[1]):
+                    chunk = numpy.ascontiguousarray(values[i:i + self.__chunks[0], j:j + self.__chunks[1]])
+                    if self.__shuffle:
+                        # Byte shuffle, as the HDF5 filter does: all first bytes, then all second bytes, and so on
+                        data = chunk.view(numpy.uint8).reshape(-1, chunk.itemsize).T.tobytes()
+                    else:
+                        data = chunk.tobytes()
+                    if self.__complevel > 0:
+                        data = zlib.compress(data, self.__complevel)
+                    write_file_atomic(os.path.join(self.__dirname, name, "{:d}.{:d}.{:d}".format(idx, i // self.__chunks[0], j // self.__chunks[1])), data)
+        # The time entry is written last, so a slice only counts as written once all of its chunks are
+        write_file_atomic(os.path.join(self.__dirname, "time", "{:d}.json".format(idx)), json.dumps({"date": date.isoformat()}).encode())
+
+    def close(self):
+        pass
+
+
+class ChunkedOutputReader:
+    # Reads the directories ChunkedOutput writes; spd and dir come back as float64 with NaN where there is no value
+    def __init__(self, dirname):
+        self.__dirname = dirname
+        with open(os.path.join(self.__dirname, "meta.json"), "r") as file:
+            self.__meta = json.load(file)
+        if self.__meta["format_version"] != 1:
+            raise RuntimeError("Unsupported chunked output format version " + str(self.__meta["format_version"]) + " in " + dirname)
+        self.__lon = numpy.array(self.__meta["lon"])
+        self.__lat = numpy.array(self.__meta["lat"])
+        self.__dtype = numpy.dtype(self.__meta["dtype"])
+
+    def lon(self):
+        return self.__lon
+
+    def lat(self):
+        return self.__lat
+
+    def num_times(self):
+        # Time slices may be appended out of order, so only count those up to the first one that is missing
+        num_times = 0
+        while os.path.exists(os.path.join(self.__dirname, "time", "{:d}.json".format(num_times))):
+            num_times += 1
+        return num_times
+
+    def get(self, idx):
+        with open(os.path.join(self.__dirname, "time", "{:d}.json".format(idx)), "r") as file:
+            date = datetime.datetime.fromisoformat(json.load(file)["date"])
+        return (date,) + tuple(self.__get_values(name, idx) for name in ("spd", "dir"))
+
+    def __get_values(self, name, idx):
+        chunk_lat, chunk_lon = self.__meta["chunks"]
+        values = numpy.zeros((len(self.__lat), len(self.__lon)), dtype=self.__dtype)
+        for i in range(0, len(self.__lat), chunk_lat):
+            for j in range(0, len(self.__lon), chunk_lon):
+                with open(os.path.join(self.__dirname, name, "{:d}.{:d}.{:d}".format(idx, i // chunk_lat, j // chunk_lon)), "rb") as file:
+                    data = file.read()
+                if self.__meta["complevel"] > 0:
+                    data = zlib.decompress(data)
+                block = values[i:i + chunk_lat, j:j + chunk_lon]
+                if self.__meta["shuffle"]:
+                    chunk = numpy.frombuffer(data, dtype=numpy.uint8).reshape(self.__dtype.itemsize, -1).T.copy().view(self.__dtype)
+                else:
+                    chunk = numpy.frombuffer(data, dtype=self.__dtype)
+                block[...] = chunk.reshape(block.shape)
+        fill = values == self.__meta["fill_value"]
+        values = values.astype(numpy.float64)
+        if self.__meta["packed"] is not None:
+            scale_factor, add_offset = self.__meta["packed"][name]
+            values = values * scale_factor + add_offset
+        values[fill] = numpy.nan
+        return values
+
+
+def write_file_atomic(filename, data):
+    with open(filename + ".tmp", "wb") as file:
+        file.write(data)
+    os.replace(filename + ".tmp", filename)
+
+
+class OutputWriter:
+    # Hands scaled time slices to NetcdfOutput; with wasync, a single writer thread takes them from a queue so the next slice can be computed meanwhile
+    # The queue holds at most queue_depth slices, so if writes fall behind, computation waits instead of holding ever more slices in memory
+    # An error on the writer thread is raised again from the next write or from close
+    # Outputs that can append several slices at once (ChunkedOutput) may use more than one writer thread; slices are then written in any order
+    # With a mask, points where it is False are written as NaN
+    # A slice can also be written a block of rows at a time, starting at row_start of the output
+    def __init__(self, output, wasync, queue_depth=2, writers=1, mask=None):
+        self.__output = output
+        self.__outside = None if mask is None else ~mask
+        self.__wasync = wasync
+        self.__queue = queue.Queue(maxsize=queue_depth)
+        self.__error = None
+        self.__did_warn = False
+        self.__thread = []
+        if self.__wasync:
+            # Daemons, so an error elsewhere in the run does not leave the process waiting on an idle writer
+            self.__thread = [threading.Thread(target=self.__run, daemon=True) for i in range(writers)]
+            for thread in self.__thread:
+                thread.start()
+
+    def __run(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            if self.__error is None:
+                try:
+                    self.__append(*item)
+                except BaseException as error:
+                    # Keep taking slices so a blocked write() wakes up and sees the error
+                    self.__error = error
+
+    def write(self, time_index, date, u_scaled, v_scaled, row_start=0):
+        if self.__outside is not None:
+            outside = self.__outside[row_start:row_start + u_scaled.shape[0]]
+            numpy.copyto(u_scaled, numpy.nan, where=outside)
+            numpy.copyto(v_scaled, numpy.nan, where=outside)
+        if not self.__wasync:
+            self.__append(time_index, date, u_scaled, v_scaled, row_start)
+            return
+        if self.__error is not None:
+            raise self.__error
+        if self.__queue.full() and not self.__did_warn:
+            print("WARNING: NetCDF writes are taking longer than computations, so computations will wait for them. "
+                  + "Especially if this warning appears early, consider using fewer threads or faster output settings.", flush=True)
+            self.__did_warn = True
+        self.__queue.put((time_index, date, u_scaled, v_scaled, row_start))
+
+    def __append(self, time_index, date, u_scaled, v_scaled, row_start):
+        start = profile_start()
+        self.__output.append(time_index, date, u_scaled, v_scaled, None, row_start)
+        if profiler is not None:
+            profiler.record("write", start, time_index, None, u_scaled.size)
+
+    def close(self, num_times):
+        # If writes are asynchronous, wait for the queue to drain
+        try:
+            if self.__thread:
+                if not self.__queue.empty():
+                    print("INFO: Still writing output for {:d} time slices of {:d}".format(self.__queue.qsize(), num_times), flush=True)
+                for thread in self.__thread:
+                    self.__queue.put(None)
+                for thread in self.__thread:
+                    thread.join()
+                if self.__error is not None:
+                    raise self.__error
+        finally:
+            self.__output.close()
+
+
 class OwiAsciiWind:
     def __init__(self, lines):
         self.__lines = lines
@@ -276,31 +1407,118 @@ class OwiAsciiWind:
         return int((end_date - start_date) / time_step + 1)
 
     def get(self, idx):
-        win_idx_header_row = 1 + 2 * math.ceil((self.__num_lats * self.__num_lons) / 8) * idx + idx
+        num_lines = math.ceil((self.__num_lats * self.__num_lons) / 8)
+        win_idx_header_row = 1 + 2 * num_lines * idx + idx
         date_str = self.__lines[win_idx_header_row][68:80]
         idx_date = datetime.datetime(int(date_str[0:4]), int(date_str[4:6]), int(date_str[6:8]), int(date_str[8:10]), int(date_str[10:12]))
-        uvel = [[None for i in range(self.__num_lons)] for j in range(self.__num_lats)]
-        for i in range(self.__num_lats * self.__num_lons):
-            low_idx = 1 + 10 * (i % 8)
-            high_idx = 10 + 10 * (i % 8)
-            line_idx = win_idx_header_row + 1 + math.floor(i / 8)
-            lon_idx = i % self.__num_lons
-            lat_idx = math.floor(i / self.__num_lons)
-            uvel[lat_idx][lon_idx] = float(self.__lines[line_idx][low_idx:high_idx])
-        vvel = [[None for i in range(self.__num_lons)] for j in range(self.__num_lats)]
-        for i in range(self.__num_lats * self.__num_lons):
-            low_idx = 1 + 10 * (i % 8)
-            high_idx = 10 + 10 * (i % 8)
-            line_idx = win_idx_header_row + 1 + math.floor(i / 8) + math.ceil((self.__num_lats * self.__num_lons) / 8)
-            lon_idx = i % self.__num_lons
-            lat_idx = math.floor(i / self.__num_lons)
-            vvel[lat_idx][lon_idx] = float(self.__lines[line_idx][low_idx:high_idx])
+        u_start = win_idx_header_row + 1
+        v_start = u_start + num_lines
+        uvel = OwiAsciiWind.decode_block(self.__lines[u_start:v_start], self.__num_lats, self.__num_lons)
+        vvel = OwiAsciiWind.decode_block(self.__lines[v_start:v_start + num_lines], self.__num_lats, self.__num_lons)
+        return WindData(idx_date, self.__grid, uvel, vvel)
+
+    @staticmethod
+    def decode_block(lines, num_lats, num_lons):
+        # Decode a block of 8-value lines (str or bytes) into a (num_lats, num_lons) array in one vectorized call
+        # Lines are padded to 80 characters so the block becomes a fixed-width table of 10-character fields;
+        # as with the original per-value parser, only characters 1-9 of each field are read
+        if len(lines) > 0 and isinstance(lines[0], str):
+            text = "".join([line.rstrip("\r\n")[:80].ljust(80) for line in lines]).encode("ascii")
+        else:
+            text = b"".join([line.rstrip(b"\r\n")[:80].ljust(80) for line in lines])
+        fields = numpy.frombuffer(text, dtype=numpy.uint8).reshape(-1, 10)[:num_lats * num_lons, 1:10]
+        values = numpy.ascontiguousarray(fields).view("S9").astype(numpy.float64)
+        return values.reshape(num_lats, num_lons)
+
+
+class OwiAsciiWindMmap:
+    # Memory-mapped alternative to OwiAsciiWind; only the bytes of the requested time slice are read, so memory use stays flat
+    # The byte offset of each time slice's header is found in one pass and saved to a sidecar index for later runs
+    def __init__(self, filename, index_filename=None):
+        self.__filename = filename
+        self.__index_filename = index_filename if index_filename is not None else filename + ".idx.npy"
+        self.__file = open(self.__filename, 'rb')
+        self.__mm = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__offsets = self.__get_index()
+        self.__grid = self.__get_grid()
+        self.__num_lats = self.__grid.n_latitude()
+        self.__num_lons = self.__grid.n_longitude()
+
+    def grid(self):
+        return self.__grid
+
+    def __header(self, idx):
+        start = int(self.__offsets[idx])
+        end = self.__mm.find(b"\n", start)
+        return self.__mm[start:end].decode("ascii"), end + 1
+
+    def __get_grid(self):
+        header, _ = self.__header(0)
+        num_lats = int(header[5:9])
+        num_lons = int(header[15:19])
+        lat_step = float(header[31:37])
+        lon_step = float(header[22:28])
+        sw_corner_lat = float(header[43:51])
+        sw_corner_lon = float(header[57:65])
+        lat = numpy.linspace(sw_corner_lat, sw_corner_lat + (num_lats - 1) * lat_step, num_lats)
+        lon = numpy.linspace(sw_corner_lon, sw_corner_lon + (num_lons - 1) * lon_step, num_lons)
+        return WindGrid(lon, lat)
+
+    def __get_index(self):
+        # The sidecar stores the file size and modification time ahead of the offsets so a stale index is never reused
+        stat = os.stat(self.__filename)
+        try:
+            index = numpy.load(self.__index_filename)
+            if index[0] == stat.st_size and index[1] == stat.st_mtime_ns:
+                return index[2:]
+        except (OSError, ValueError):
+            pass
+        offsets = self.__build_index()
+        try:
+            numpy.save(self.__index_filename, numpy.concatenate(([stat.st_size, stat.st_mtime_ns], offsets)).astype(numpy.int64))
+        except OSError:
+            print("WARNING: Unable to save OWI ASCII index to " + self.__index_filename + "; it will be rebuilt on the next run", flush=True)
+        return offsets
+
+    def __build_index(self):
+        # "DT=" only appears in time slice headers, so searching for it hops from header to header without splitting lines
+        offsets = []
+        pos = self.__mm.find(b"DT=")
+        while pos != -1:
+            offsets.append(self.__mm.rfind(b"\n", 0, pos) + 1)
+            release_mmap_pages(self.__mm, offsets[-2] if len(offsets) > 1 else 0, offsets[-1])
+            pos = self.__mm.find(b"DT=", pos + 3)
+        release_mmap_pages(self.__mm, offsets[-1] if offsets else 0, len(self.__mm))
+        return numpy.array(offsets, dtype=numpy.int64)
+
+    def num_times(self):
+        return len(self.__offsets)
+
+    def get(self, idx):
+        header, data_start = self.__header(idx)
+        data_end = int(self.__offsets[idx + 1]) if idx + 1 < len(self.__offsets) else len(self.__mm)
+        date_str = header[68:80]
+        idx_date = datetime.datetime(int(date_str[0:4]), int(date_str[4:6]), int(date_str[6:8]), int(date_str[8:10]), int(date_str[10:12]))
+        num_lines = math.ceil((self.__num_lats * self.__num_lons) / 8)
+        lines = self.__mm[data_start:data_end].splitlines()
+        release_mmap_pages(self.__mm, int(self.__offsets[idx]), data_end)
+        uvel = OwiAsciiWind.decode_block(lines[0:num_lines], self.__num_lats, self.__num_lons)
+        vvel = OwiAsciiWind.decode_block(lines[num_lines:2 * num_lines], self.__num_lats, self.__num_lons)
         return WindData(idx_date, self.__grid, uvel, vvel)
 
+    def close(self):
+        self.__mm.close()
+        self.__file.close()
+
 
 class OwiNetcdf:
-    def __init__(self, filename):
+    def __init__(self, filename, cache_size=None, cache_preemption=None):
         self.__nc = netCDF4.Dataset(filename, "r")
+        self.__nc.set_auto_mask(False)  # WindData only keeps the raw values, so skip building masked arrays
+        self.__u10 = self.__nc["Main"].variables["U10"]
+        self.__v10 = self.__nc["Main"].variables["V10"]
+        self.__time = self.__nc["Main"].variables["time"]
+        self.__set_chunk_cache(cache_size, cache_preemption)
         self.__grid = self.__get_grid()
 
     def grid(self):
@@ -311,15 +1529,33 @@ class OwiNetcdf:
         lat = self.__nc["Main"].variables["lat"][:, 0]
         return WindGrid(lon, lat)
 
+    def __set_chunk_cache(self, cache_size, cache_preemption):
+        # Reading slices in order only avoids decompressing the same chunks again if the cache can hold every chunk that
+        # intersects one time index; by default, size the cache for that plus some headroom
+        for var in (self.__u10, self.__v10):
+            chunking = var.chunking()
+            size, nelems, preemption = var.get_var_chunk_cache()
+            if cache_size is not None:
+                size = int(cache_size)
+            elif chunking != "contiguous":
+                chunk_bytes = var.dtype.itemsize * int(numpy.prod(chunking))
+                chunks_per_time = math.ceil(var.shape[1] / chunking[1]) * math.ceil(var.shape[2] / chunking[2])
+                size = max(size, 2 * chunks_per_time * chunk_bytes)
+                nelems = max(nelems, 4 * chunks_per_time + 1)
+            if cache_preemption is not None:
+                preemption = cache_preemption
+            var.set_var_chunk_cache(size=size, nelems=nelems, preemption=preemption)
+
     def num_times(self):
-        return self.__nc["Main"].variables["time"].size
+        return self.__time.size
 
     def get(self, idx):
+        # Index all dimensions at once so only the requested time slice is read from disk
         base_date = datetime.datetime(1990, 1, 1, 0, 0, 0)
-        m_added = int(self.__nc["Main"].variables["time"][idx])
+        m_added = int(self.__time[idx])
         idx_date = base_date + datetime.timedelta(minutes=m_added)
-        uvel = self.__nc["Main"].variables["U10"][:][:][idx]
-        vvel = self.__nc["Main"].variables["V10"][:][:][idx]
+        uvel = self.__u10[idx, :, :]
+        vvel = self.__v10[idx, :, :]
         return WindData(idx_date, self.__grid, uvel, vvel)
 
     def close(self):
@@ -398,16 +1634,71 @@ class WndWind:
 
     def get(self, idx):
         idx_date = self.__wind_inp.start_time() + datetime.timedelta(hours=idx * self.__wind_inp.time_step())
-        uvel = [[None for i in range(self.__num_lons)] for j in range(self.__num_lats)]
-        vvel = [[None for i in range(self.__num_lons)] for j in range(self.__num_lats)]
-        for i in range(self.__num_lats * self.__num_lons):
-            line_idx = self.__num_lats * self.__num_lons * idx + i
-            lon_idx = i % self.__num_lons
-            lat_idx = self.__num_lats - math.floor(i / self.__num_lons) - 1  # WND starts in the NW corner and goes row by row
-            uvel[lat_idx][lon_idx] = float(self.__lines[line_idx][0:9])
-            vvel[lat_idx][lon_idx] = float(self.__lines[line_idx][10:19])
+        num_points = self.__num_lats * self.__num_lons
+        uvel, vvel = WndWind.decode_block(self.__lines[num_points * idx:num_points * (idx + 1)], self.__num_lats, self.__num_lons)
+        return WindData(idx_date, self.__grid, uvel, vvel)
+
+    @staticmethod
+    def decode_block(lines, num_lats, num_lons):
+        # Decode one time slice of WND lines (str or bytes) into U and V arrays, parsing both columns in one vectorized call
+        if len(lines) > 0 and isinstance(lines[0], str):
+            text = "".join([line.rstrip("\r\n")[:19].ljust(19) for line in lines]).encode("ascii")
+        else:
+            text = b"".join([line.rstrip(b"\r\n")[:19].ljust(19) for line in lines])
+        return WndWind.decode_table(numpy.frombuffer(text, dtype=numpy.uint8).reshape(-1, 19), num_lats, num_lons)
+
+    @staticmethod
+    def decode_table(table, num_lats, num_lons):
+        # table is a (num_lats * num_lons, line_width) array of characters; U is in columns 0-8 and V in columns 10-18
+        fields = numpy.concatenate((table[:, 0:9], table[:, 10:19]), axis=1)
+        values = fields.view("S9").astype(numpy.float64).reshape(num_lats, num_lons, 2)
+        values = values[::-1]  # WND starts in the NW corner and goes row by row; flip to south-north as a view
+        return values[:, :, 0], values[:, :, 1]
+
+
+class WndWindMmap:
+    # Memory-mapped alternative to WndWind; WND lines are fixed width, so each time slice's byte range follows from WndWindInp
+    def __init__(self, filename, wind_inp):
+        self.__file = open(filename, 'rb')
+        self.__mm = mmap.mmap(self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+        self.__wind_inp = wind_inp
+        self.__num_lats = self.__wind_inp.num_lats()
+        self.__num_lons = self.__wind_inp.num_lons()
+        self.__line_width = self.__mm.find(b"\n") + 1
+        if self.__line_width < 20 or len(self.__mm) < self.__line_width * self.__num_lats * self.__num_lons * self.__wind_inp.num_times():
+            raise RuntimeError("WND file does not match Wind_Inp.txt metadata or does not have fixed-width lines; try again without -mmap")
+        lat_step = self.__wind_inp.spatial_res()
+        lon_step = self.__wind_inp.spatial_res()
+        lat = numpy.linspace(self.__wind_inp.s_lim(), self.__wind_inp.s_lim() + (self.__num_lats - 1) * lat_step, self.__num_lats)
+        lon = numpy.linspace(self.__wind_inp.w_lim(), self.__wind_inp.w_lim() + (self.__num_lons - 1) * lon_step, self.__num_lons)
+        self.__grid = WindGrid(lon, lat)
+
+    def grid(self):
+        return self.__grid
+
+    def get(self, idx):
+        idx_date = self.__wind_inp.start_time() + datetime.timedelta(hours=idx * self.__wind_inp.time_step())
+        num_points = self.__num_lats * self.__num_lons
+        start = num_points * self.__line_width * idx
+        table = numpy.frombuffer(self.__mm, dtype=numpy.uint8, count=num_points * self.__line_width, offset=start).reshape(num_points, self.__line_width)
+        if not (table[:, -1] == ord("\n")).all():
+            raise RuntimeError("WND time slice {:d} does not have fixed-width lines; try again without -mmap".format(idx))
+        uvel, vvel = WndWind.decode_table(table, self.__num_lats, self.__num_lons)
+        del table  # Release the exported buffer so the mapping can be closed
+        release_mmap_pages(self.__mm, start, start + num_points * self.__line_width)
         return WindData(idx_date, self.__grid, uvel, vvel)
 
+    def close(self):
+        self.__mm.close()
+        self.__file.close()
+
+
+def release_mmap_pages(mm, start, end):
+    # Drop pages of a read-only mapping we are done with so they do not accumulate in resident memory
+    if hasattr(mm, "madvise") and hasattr(mmap, "MADV_DONTNEED"):
+        start = start - start % mmap.PAGESIZE
+        mm.madvise(mmap.MADV_DONTNEED, start, end - start)
+
 
 def dir_met_to_and_from_math(direction):
     return (270 - direction) % 360  # Formula is the same each way
@@ -426,30 +1717,60 @@ def magnitude_from_uv(u_vel, v_vel):
     return numpy.sqrt(u_vel**2 + v_vel**2)
 
 
+def spd_dir_from_uv(u_vel, v_vel, spd=None, direction=None):
+    # Speed and meteorological direction (coming from) in one pass, written into spd and direction if they are provided
+    # Same as magnitude_from_uv and dir_met_to_and_from_math(direction_from_uv), including a NaN direction where the wind is calm
+    spd = numpy.hypot(u_vel, v_vel, out=spd)
+    direction = numpy.arctan2(u_vel, v_vel, out=direction)  # Math direction the wind is going to, rotated to north = 0 and clockwise
+    numpy.rad2deg(direction, out=direction)
+    direction += 180  # Going to -> coming from
+    numpy.mod(direction, 360, out=direction)
+    numpy.copyto(direction, numpy.nan, where=spd == 0)
+    return spd, direction
+
+
 def angle_diff(deg1, deg2):
     delta = deg1 - deg2
     return abs((delta + 180) % 360 - 180)
 
 
-def generate_directional_z0_interpolant(lon_grid, lat_grid, z0_hr_hr_grid, sigma, radius):
+def directional_z0_lookup(z0_directional, angle, direction, points=None, dtype=None):
+    # Linear interpolation between the two sector z0 values that bracket each point's direction
+    # This is what RegularGridInterpolator reduces to at the interpolant's own lat/lon nodes, without its N-D search or 3-D coordinate stacking
+    # Calm points (undefined direction) use the first sector; their wind speed is 0, so the choice does not matter
+    # With points, direction is only for those flat indices of the (lat, lon) grid; with dtype, the sector values are converted before interpolating
+    n_angle = len(angle)
+    direction = numpy.nan_to_num(direction, nan=angle[0])
+    low = numpy.clip(numpy.searchsorted(angle, direction, side="right") - 1, 0, n_angle - 2)
+    frac = (direction - angle[low]) / (angle[low + 1] - angle[low])
+    flat_low = (numpy.arange(low.size).reshape(low.shape) if points is None else points) * n_angle + low
+    z0_flat = z0_directional.reshape(-1)
+    z0_low = z0_flat[flat_low]
+    z0_high = z0_flat[flat_low + 1]
+    if dtype is not None:
+        z0_low = z0_low.astype(dtype, copy=False)
+        z0_high = z0_high.astype(dtype, copy=False)
+    return z0_low * (1 - frac) + z0_high * frac
+
+
+def directional_z0_kernels(lon, lat, sigma, radius):
     # Generate a defined number of circular sectors ("cones") around each point in the RICHAMP grid
     # Use a Gaussian decay function to calculate a weighted z0 value for each cone based on the discrete z0 values within the cone
     # Use the same weighting function as John Ratcliff & Rick Luettich
-    overall_mid_lat = (lat_grid[0, 0] + lat_grid[-1, 0]) / 2  # degrees N
-    overall_mid_lon = (lon_grid[0, 0] + lon_grid[0, -1]) / 2  # degrees E
+    # The cones are built once around the middle of the grid and reused at every point, so only the 1D axes of the grid are needed
+    overall_mid_lat = (lat[0] + lat[-1]) / 2  # degrees N
+    overall_mid_lon = (lon[0] + lon[-1]) / 2  # degrees E
     cone_width = 30  # degrees
     half_cone_width = cone_width / 2
     cone_ctr_angle = numpy.linspace(0, 360, 13)
     wgs84_geod = pyproj.Geod(ellps='WGS84')
-    _, _, approx_grid_resolution = wgs84_geod.inv(lon_grid[0, 0], lat_grid[0, 0], lon_grid[0, 0],
-                                                  lat_grid[1, 0])  # assumes same resolution in lat and lon
+    _, _, approx_grid_resolution = wgs84_geod.inv(lon[0], lat[0], lon[0], lat[1])  # assumes same resolution in lat and lon
     _, _, one_deg_lon = wgs84_geod.inv(overall_mid_lon - 0.5, overall_mid_lat, overall_mid_lon + 0.5, overall_mid_lat)
     _, _, one_deg_lat = wgs84_geod.inv(overall_mid_lon, overall_mid_lat - 0.5, overall_mid_lon, overall_mid_lat + 0.5)
     n_fwd_back = math.ceil(radius / approx_grid_resolution)
-    n_lat = len(z0_hr_hr_grid)
-    n_lon = len(z0_hr_hr_grid[0])
+    n_lat = len(lat)
+    n_lon = len(lon)
     n_z0 = len(cone_ctr_angle) - 1  # A row for 360 degrees exists to allow interpolation between 330 and 0, but we don't calculate z0 for it
-    z0_directional = numpy.zeros((n_lat, n_lon, n_z0 + 1))
     # Pre-calculate distance and angle for points that could be in_cone
     mid_lon = math.ceil(n_lon / 2)
     mid_lat = math.ceil(n_lat / 2)
@@ -458,16 +1779,39 @@ def generate_directional_z0_interpolant(lon_grid, lat_grid, z0_hr_hr_grid, sigma
     lat_start = mid_lat - n_fwd_back
     lat_end = mid_lat + n_fwd_back + 1
     full_end = 2 * n_fwd_back + 1
-    _, _, distance = wgs84_geod.inv(numpy.zeros((full_end, full_end)) + lon_grid[mid_lat, mid_lon], numpy.zeros((full_end, full_end)) + lat_grid[mid_lat, mid_lon],
-                                    lon_grid[lat_start:lat_end, lon_start:lon_end], lat_grid[lat_start:lat_end, lon_start:lon_end])
+    lon_cone, lat_cone = numpy.meshgrid(lon[lon_start:lon_end], lat[lat_start:lat_end])
+    _, _, distance = wgs84_geod.inv(numpy.zeros((full_end, full_end)) + lon[mid_lon], numpy.zeros((full_end, full_end)) + lat[mid_lat], lon_cone, lat_cone)
     weight = numpy.exp(-distance**2 / (2 * sigma**2))
-    direction = direction_from_uv(one_deg_lon * (lon_grid[mid_lat, mid_lon] - lon_grid[lat_start:lat_end, lon_start:lon_end]),
-                                  one_deg_lat * (lat_grid[mid_lat, mid_lon] - lat_grid[lat_start:lat_end, lon_start:lon_end]))
+    direction = direction_from_uv(one_deg_lon * (lon[mid_lon] - lon_cone), one_deg_lat * (lat[mid_lat] - lat_cone))
     in_cone_if_in_grid = numpy.zeros((full_end, full_end, n_z0), dtype=bool)
-    full_cone_weight = numpy.zeros((n_z0))
     for k in range(n_z0):
         in_cone_if_in_grid[:, :, k] = numpy.logical_and(distance <= radius, angle_diff(direction, cone_ctr_angle[k]) <= half_cone_width)
         in_cone_if_in_grid[n_fwd_back, n_fwd_back, k] = True  # the point of interest must be in every cone
+    return cone_ctr_angle, n_fwd_back, weight, in_cone_if_in_grid
+
+
+def generate_directional_z0_interpolant(lon_grid, lat_grid, z0_hr_hr_grid, sigma, radius, method="fft"):
+    cone_ctr_angle, n_fwd_back, weight, in_cone_if_in_grid = directional_z0_kernels(lon_grid[0, :], lat_grid[:, 0], sigma, radius)
+    if method == "fft":
+        z0_directional = directional_z0_fft(z0_hr_hr_grid, weight, in_cone_if_in_grid)
+    else:
+        z0_directional = directional_z0_loop(z0_hr_hr_grid, n_fwd_back, weight, in_cone_if_in_grid)
+    # Create interpolant
+    z0_directional_interpolant = scipy.interpolate.RegularGridInterpolator(
+        (lat_grid[:, 0], lon_grid[0, :], cone_ctr_angle), z0_directional, method='linear')
+    print("INFO: Interpolant generation 100% complete", flush=True)
+    return z0_directional_interpolant
+
+
+def directional_z0_loop(z0_hr_hr_grid, n_fwd_back, weight, in_cone_if_in_grid):
+    # Reference implementation: weighted sums over each cone, one point at a time
+    n_lat = len(z0_hr_hr_grid)
+    n_lon = len(z0_hr_hr_grid[0])
+    n_z0 = in_cone_if_in_grid.shape[2]
+    full_end = 2 * n_fwd_back + 1
+    z0_directional = numpy.zeros((n_lat, n_lon, n_z0 + 1))
+    full_cone_weight = numpy.zeros((n_z0))
+    for k in range(n_z0):
         full_cone_weight[k] = sum(weight[in_cone_if_in_grid[:, :, k]])
     # Calculate z0 for each cone at each point
     old_pct_complete = 0
@@ -496,55 +1840,189 @@ def generate_directional_z0_interpolant(lon_grid, lat_grid, z0_hr_hr_grid, sigma
                     z0_directional[i, j, k] = sum(weight[in_cone_if_in_grid[:, :, k]] * z0_hr_hr_grid[lat_start:lat_end,
                                                   lon_start:lon_end][in_cone_if_in_grid[:, :, k]]) / full_cone_weight[k]
     z0_directional[:, :, n_z0] = z0_directional[:, :, 0]  # 360 degrees and 0 degrees are the same
-    # Create interpolant
+    return z0_directional
+
+
+def directional_z0_fft(z0_hr_hr_grid, weight, in_cone_if_in_grid):
+    # Each cone is a fixed Gaussian-weighted sector kernel, so the weighted sums over every point are one 2D convolution per cone
+    # Near the edges, part of the cone falls outside the grid; convolving a validity mask with the same kernel gives exactly the
+    # weight that remains, which reproduces the edge normalization of directional_z0_loop
+    z0_hr_hr_grid = numpy.asarray(z0_hr_hr_grid, dtype=numpy.float64)
+    n_z0 = in_cone_if_in_grid.shape[2]
+    valid = numpy.ones(z0_hr_hr_grid.shape)
+    z0_directional = numpy.zeros(z0_hr_hr_grid.shape + (n_z0 + 1,))
+    for k in range(n_z0):
+        kernel = (weight * in_cone_if_in_grid[:, :, k])[::-1, ::-1]  # Flipped, so the convolution is the same weighted sum as the loop
+        z0_directional[:, :, k] = scipy.signal.fftconvolve(z0_hr_hr_grid, kernel, mode="same") / scipy.signal.fftconvolve(valid, kernel, mode="same")
+    z0_directional[:, :, n_z0] = z0_directional[:, :, 0]  # 360 degrees and 0 degrees are the same
+    return z0_directional
+
+
+def generate_directional_z0_tiled(filename, lon, lat, sigma, radius, tile_size, workers, scratch_name, source_sha256=None):
+    # Same result as generate_directional_z0_interpolant with method fft for the roughness file filename with axes lon and lat, but computed
+    # tile by tile on a process pool
+    # Each tile is convolved with a halo of n_fwd_back points (the cone radius) on every side, so interior tiles see the full cones
+    # and tiles on the domain edge are cut off exactly where the domain is
+    # Each worker reads just its tile's halo from the file, so the whole roughness grid is never in memory, here or in a worker
+    # Tiles are written to <scratch_name>.npy as they complete and marked done in <scratch_name>.tiles, so an interrupted run picks up where it left off
+    # Scratch data from different settings or a different roughness file (by source_sha256, as from file_sha256) is discarded instead
+    cone_ctr_angle, n_fwd_back, weight, in_cone_if_in_grid = directional_z0_kernels(lon, lat, sigma, radius)
+    n_lat, n_lon = len(lat), len(lon)
+    shape = (n_lat, n_lon, len(cone_ctr_angle))
+    cube_filename = scratch_name + ".npy"
+    tiles_dirname = scratch_name + ".tiles"
+    meta = {"shape": list(shape), "sigma": sigma, "radius": radius, "tile_size": tile_size, "source_sha256": source_sha256}
+    meta_filename = os.path.join(tiles_dirname, "meta.json")
+    resume = os.path.exists(cube_filename) and os.path.exists(meta_filename)
+    if resume:
+        with open(meta_filename, "r") as file:
+            resume = json.load(file) == meta
+        if not resume:
+            print("INFO: Discarding directional z0 tiles from an interrupted run with different settings or roughness", flush=True)
+    if not resume:
+        shutil.rmtree(tiles_dirname, ignore_errors=True)
+        os.makedirs(tiles_dirname)
+        numpy.lib.format.open_memmap(cube_filename, mode="w+", dtype=numpy.float64, shape=shape).flush()
+        with open(meta_filename, "w") as file:
+            json.dump(meta, file)
+    tiles = []
+    for lat_start in range(0, n_lat, tile_size):
+        for lon_start in range(0, n_lon, tile_size):
+            tile = (lat_start, min(n_lat, lat_start + tile_size), lon_start, min(n_lon, lon_start + tile_size))
+            if not os.path.exists(directional_z0_tile_marker(tiles_dirname, tile)):
+                tiles.append(tile)
+    n_tiles = math.ceil(n_lat / tile_size) * math.ceil(n_lon / tile_size)
+    if len(tiles) < n_tiles:
+        print("INFO: Resuming directional z0 generation; " + str(n_tiles - len(tiles)) + " of " + str(n_tiles) + " tiles already done", flush=True)
+    # Only a bounded number of tiles are in flight, so progress is reported as they complete
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=directional_z0_tile_init,
+                                                initargs=(filename, weight, in_cone_if_in_grid, cube_filename, tiles_dirname)) as executor:
+        pending = set()
+        n_done = n_tiles - len(tiles)
+        old_pct_complete = math.floor(100 * n_done / n_tiles)
+        for tile in tiles + [None] * (2 * workers):
+            if tile is not None:
+                lat_start, lat_end, lon_start, lon_end = tile
+                halo = (max(0, lat_start - n_fwd_back), min(n_lat, lat_end + n_fwd_back), max(0, lon_start - n_fwd_back), min(n_lon, lon_end + n_fwd_back))
+                pending.add(executor.submit(directional_z0_tile_run, [tile, halo]))
+            if len(pending) >= 2 * workers or (tile is None and pending):
+                done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+                    n_done += 1
+                pct_complete = math.floor(100 * n_done / n_tiles)
+                if pct_complete != old_pct_complete and pct_complete < 100:
+                    print("INFO: Interpolant generation " + str(pct_complete) + "% complete", flush=True)
+                    old_pct_complete = pct_complete
+    z0_directional = numpy.load(cube_filename, mmap_mode="r")
     z0_directional_interpolant = scipy.interpolate.RegularGridInterpolator(
-        (lat_grid[:, 0], lon_grid[0, :], cone_ctr_angle), z0_directional, method='linear')
+        (lat, lon, cone_ctr_angle), z0_directional, method='linear')
     print("INFO: Interpolant generation 100% complete", flush=True)
     return z0_directional_interpolant
 
 
-def roughness_adjust(subd_inputs):
-    # NOTE: Past versions of this function derived z0 from wind stress over water
-    # That is not feasible performance-wise while also calculating directional z0, so that functionality has been removed
-    # Constant z0 values directly from the appropriate roughness file are now used over water
-    input_wind, input_wback, wfmt, wbackfmt, z0_wr, z0_wbackr, z0_hr, z0_directional_interpolant, sl, \
-        lon_ctr_interpolant, lat_ctr_interpolant, rmw_interpolant, time_ctr_date_0, time_rmw_date_0 = subd_inputs
-    if (wfmt == "owi-ascii") | (wfmt == "owi-netcdf"):
-        z0_wr_w_grid = z0_to_wind_res(z0_wr, input_wind)
-    elif wfmt == "wnd":
-        z0_wr_w_grid = z0_wr
+def remove_directional_z0_tiles(scratch_name):
+    shutil.rmtree(scratch_name + ".tiles", ignore_errors=True)
+    if os.path.exists(scratch_name + ".npy"):
+        os.remove(scratch_name + ".npy")
+
+
+def directional_z0_tile_marker(tiles_dirname, tile):
+    return os.path.join(tiles_dirname, "{:d}_{:d}_{:d}_{:d}.done".format(*tile))
+
+
+directional_z0_tile_state = None
+
+
+def directional_z0_tile_init(filename, weight, in_cone_if_in_grid, cube_filename, tiles_dirname):
+    global directional_z0_tile_state
+    directional_z0_tile_state = (filename, weight, in_cone_if_in_grid, numpy.load(cube_filename, mmap_mode="r+"), tiles_dirname)
+
+
+def directional_z0_tile_run(tile_inputs):
+    tile, halo = tile_inputs
+    filename, weight, in_cone_if_in_grid, z0_directional, tiles_dirname = directional_z0_tile_state
+    lat_start, lat_end, lon_start, lon_end = tile
+    _, _, z0_halo = Roughness.get(filename, halo)
+    z0_directional_halo = directional_z0_fft(z0_halo, weight, in_cone_if_in_grid)
+    z0_directional[lat_start:lat_end, lon_start:lon_end, :] = z0_directional_halo[lat_start - halo[0]:lat_end - halo[0], lon_start - halo[2]:lon_end - halo[2], :]
+    # The tile only counts as done once its values are on disk
+    z0_directional.flush()
+    open(directional_z0_tile_marker(tiles_dirname, tile), "w").close()
+
+
+def wind_adjust(input_wind, input_wback, wind_plan, blend_inputs):
+    # Per-slice work on the wind grid, done once for all subdomains: blend with the background wind if provided
+    # For up-down scaling, the result is at z_ref rather than 10m
+    sl = wind_plan.sl()
     if sl == "adcirc":
-        # Interpolate z0_wr to z0_hr resolution and blend if necessary
         if input_wback is not None:
             # Scale input_wback to same roughness as input_wind, then blend
-            input_wback_w_grid = wind_to_wind_res(input_wback, input_wind)
-            z0_wbackr_w_grid = z0_to_wind_res(z0_wbackr, input_wind)
-            input_wback_scaled = adcirc_scaling(input_wback_w_grid, z0_wbackr_w_grid.land_rough(), z0_wr_w_grid.land_rough())
-            wind_w_grid = blend(input_wind, input_wback_scaled, lon_ctr_interpolant,
-                                lat_ctr_interpolant, rmw_interpolant, time_ctr_date_0, time_rmw_date_0)
+            u_wback, v_wback = wind_plan.wback_to_wind().apply(input_wback.u_velocity(), input_wback.v_velocity())
+            input_wback_w_grid = WindData(input_wback.date(), wind_plan.wind_grid(), u_wback, v_wback)
+            input_wback_scaled = adcirc_scaling(input_wback_w_grid, wind_plan.z0_wbackr_w_grid(), wind_plan.z0_wr_w_grid())
+            wind_w_grid = blend(input_wind, input_wback_scaled, *blend_inputs)
         else:
             wind_w_grid = input_wind
-        z0_wr_hr_grid = z0_to_z0_res(z0_wr_w_grid, z0_hr)
     elif sl == "up-down":
         # Scale up to z_ref and blend if necessary
-        input_wind_z_ref = ten_to_zref(z0_wr_w_grid.land_rough(), input_wind)
+        input_wind_z_ref = ten_to_zref(wind_plan.z0_wr_w_grid(), input_wind)
         if input_wback is not None:
-            z0_wbackr_wback_grid = z0_to_wind_res(z0_wbackr, input_wback)
-            input_wback_z_ref = ten_to_zref(z0_wbackr_wback_grid.land_rough(), input_wback)
-            input_wback_z_ref_w_grid = wind_to_wind_res(input_wback_z_ref, input_wind)
-            wind_w_grid = blend(input_wind_z_ref, input_wback_z_ref_w_grid, lon_ctr_interpolant,
-                                lat_ctr_interpolant, rmw_interpolant, time_ctr_date_0, time_rmw_date_0)
+            input_wback_z_ref = ten_to_zref(wind_plan.z0_wbackr_wback_grid(), input_wback)
+            u_wback, v_wback = wind_plan.wback_to_wind().apply(input_wback_z_ref.u_velocity(), input_wback_z_ref.v_velocity())
+            input_wback_z_ref_w_grid = WindData(input_wback_z_ref.date(), wind_plan.wind_grid(), u_wback, v_wback)
+            wind_w_grid = blend(input_wind_z_ref, input_wback_z_ref_w_grid, *blend_inputs)
         else:
             wind_w_grid = input_wind_z_ref
+    return wind_w_grid
+
+
+def roughness_adjust(subd_inputs):
+    # NOTE: Past versions of this function derived z0 from wind stress over water
+    # That is not feasible performance-wise while also calculating directional z0, so that functionality has been removed
+    # Constant z0 values directly from the appropriate roughness file are now used over water
+    # Everything that does not depend on time comes precomputed from subd_plan, so only wind arrays are touched here
+    # An optional third input, (time_index, subdomain), labels the stages for the profiler
+    wind_w_grid, subd_plan = subd_inputs[:2]
+    time_index, subdomain = subd_inputs[2] if len(subd_inputs) > 2 else (None, None)
     # Determine z0 based on wind direction, then scale wind with directional z0
-    z0_hr_grid = WindGrid(z0_hr.lon(), z0_hr.lat())
-    wind_hr_grid = wind_to_z0_res(wind_w_grid, z0_hr)
-    dir_hr_grid = direction_from_uv(wind_hr_grid.u_velocity(), wind_hr_grid.v_velocity())
-    z0_hr_directional = z0_directional_interpolant((z0_hr_grid.lat(), z0_hr_grid.lon(), dir_hr_grid))
-    if sl == "adcirc":
-        wind_out = adcirc_scaling(wind_hr_grid, z0_wr_hr_grid.land_rough(), z0_hr_directional)
-    elif sl == "up-down":
+    z0_hr_grid = subd_plan.z0_hr_grid()
+    start = profile_start()
+    u_hr, v_hr = subd_plan.wind_to_hr().apply(wind_w_grid.u_velocity(), wind_w_grid.v_velocity())
+    if profiler is not None:
+        profiler.record("interpolate", start, time_index, subdomain, u_hr.size)
+        start = profile_start()
+    if subd_plan.static_factor() is not None:
+        # Scale the points where direction does not matter in bulk, then redo just the mixed points with their directional z0
+        mixed = subd_plan.mixed_points()
+        wind_mixed = WindData(wind_w_grid.date(), None, u_hr.reshape(-1)[mixed], v_hr.reshape(-1)[mixed])
+        z0_mixed_directional = subd_plan.mixed_z0_directional(direction_from_uv(wind_mixed.u_velocity(), wind_mixed.v_velocity()))
+        if profiler is not None:
+            profiler.record("directional z0", start, time_index, subdomain, mixed.size)
+            start = profile_start()
+        if subd_plan.sl() == "adcirc":
+            wind_mixed = adcirc_scaling(wind_mixed, subd_plan.mixed_z0_wr_hr_grid(), z0_mixed_directional)
+        elif subd_plan.sl() == "up-down":
+            wind_mixed = zref_to_ten(z0_mixed_directional, wind_mixed)
+        u_out = u_hr * subd_plan.static_factor()
+        v_out = v_hr * subd_plan.static_factor()
+        u_out.reshape(-1)[mixed] = wind_mixed.u_velocity()
+        v_out.reshape(-1)[mixed] = wind_mixed.v_velocity()
+        if profiler is not None:
+            profiler.record("scale", start, time_index, subdomain, u_out.size)
+        return WindData(wind_w_grid.date(), z0_hr_grid, u_out, v_out)
+    wind_hr_grid = WindData(wind_w_grid.date(), z0_hr_grid, u_hr, v_hr)
+    dir_hr_grid = direction_from_uv(u_hr, v_hr)
+    z0_hr_directional = subd_plan.z0_directional(dir_hr_grid)
+    if profiler is not None:
+        profiler.record("directional z0", start, time_index, subdomain, u_hr.size)
+        start = profile_start()
+    if subd_plan.sl() == "adcirc":
+        wind_out = adcirc_scaling(wind_hr_grid, subd_plan.z0_wr_hr_grid(), z0_hr_directional)
+    elif subd_plan.sl() == "up-down":
         wind_out = zref_to_ten(z0_hr_directional, wind_hr_grid)
+    if profiler is not None:
+        profiler.record("scale", start, time_index, subdomain, u_hr.size)
     return wind_out
 
 
@@ -557,51 +2035,47 @@ def adcirc_scaling(wind_inp, z0_inp, z0_tgt):
 
 def wind_to_wind_res(wind_inp, wind_tgt):
     # Interpolate a WindData object to the spatial resolution of another WindData object
-    u_interp = scipy.interpolate.RectBivariateSpline(wind_inp.wind_grid().lat1d(), wind_inp.wind_grid().lon1d(), wind_inp.u_velocity(), kx=1, ky=1)
-    u_wind_tgt_res = u_interp(wind_tgt.wind_grid().lat1d(), wind_tgt.wind_grid().lon1d())
-    v_interp = scipy.interpolate.RectBivariateSpline(wind_inp.wind_grid().lat1d(), wind_inp.wind_grid().lon1d(), wind_inp.v_velocity(), kx=1, ky=1)
-    v_wind_tgt_res = v_interp(wind_tgt.wind_grid().lat1d(), wind_tgt.wind_grid().lon1d())
+    regridder = Regridder.get(wind_inp.wind_grid().lon1d(), wind_inp.wind_grid().lat1d(), wind_tgt.wind_grid().lon1d(), wind_tgt.wind_grid().lat1d())
+    u_wind_tgt_res, v_wind_tgt_res = regridder.apply(wind_inp.u_velocity(), wind_inp.v_velocity())
     return WindData(wind_inp.date(), wind_tgt.wind_grid(), u_wind_tgt_res, v_wind_tgt_res)
 
 
 def wind_to_z0_res(wind, z0):
     # Interpolate a WindData object to the spatial resolution of a Roughness object
-    u_interp = scipy.interpolate.RectBivariateSpline(wind.wind_grid().lat1d(), wind.wind_grid().lon1d(), wind.u_velocity(), kx=1, ky=1)
-    u_z0_res = u_interp(z0.lat(), z0.lon())
-    v_interp = scipy.interpolate.RectBivariateSpline(wind.wind_grid().lat1d(), wind.wind_grid().lon1d(), wind.v_velocity(), kx=1, ky=1)
-    v_z0_res = v_interp(z0.lat(), z0.lon())
+    regridder = Regridder.get(wind.wind_grid().lon1d(), wind.wind_grid().lat1d(), z0.lon(), z0.lat())
+    u_z0_res, v_z0_res = regridder.apply(wind.u_velocity(), wind.v_velocity())
     return WindData(wind.date(), WindGrid(z0.lon(), z0.lat()), u_z0_res, v_z0_res)
 
 
 def z0_to_wind_res(z0, wind):
     # Interpolate a Roughness object to the spatial resolution of a WindData object
-    z0_wr_interp = scipy.interpolate.RectBivariateSpline(z0.lat(), z0.lon(), z0.land_rough(), kx=1, ky=1)
-    z0_w_res = z0_wr_interp(wind.wind_grid().lat1d(), wind.wind_grid().lon1d())
+    regridder = Regridder.get(z0.lon(), z0.lat(), wind.wind_grid().lon1d(), wind.wind_grid().lat1d())
+    z0_w_res = regridder.apply(z0.land_rough())[0]
     return Roughness(wind.wind_grid().lon1d(), wind.wind_grid().lat1d(), z0_w_res)
 
 
 def z0_to_z0_res(z0_inp, z0_tgt):
     # Interpolate a Roughness object to the spatial resolution of another Roughness object
-    z0_wr_interp = scipy.interpolate.RectBivariateSpline(z0_inp.lat(), z0_inp.lon(), z0_inp.land_rough(), kx=1, ky=1)
-    z0_w_res = z0_wr_interp(z0_tgt.lat(), z0_tgt.lon())
+    regridder = Regridder.get(z0_inp.lon(), z0_inp.lat(), z0_tgt.lon(), z0_tgt.lat())
+    z0_w_res = regridder.apply(z0_inp.land_rough())[0]
     return Roughness(z0_tgt.lon(), z0_tgt.lat(), z0_w_res)
 
 
 def ten_to_zref(z0, wind):
     # Scale using equations 9 & 10 here: https://dr.lib.iastate.edu/handle/20.500.12876/1131
     z_ref = 80  # Per Isaac the logarithmic profile only applies in the near surface layer, which extends roughly 80m up; to verify with lit review
-    b = 1 / (numpy.log(10) - numpy.log(z0))  # Eq 10
-    uvel = wind.u_velocity() * (1 + b * numpy.log(z_ref / 10))  # Eq 9
-    vvel = wind.v_velocity() * (1 + b * numpy.log(z_ref / 10))  # Eq 9
+    b = 1 / (math.log(10) - numpy.log(z0))  # Eq 10; math.log keeps the constants Python floats, so float32 z0 stays float32
+    uvel = wind.u_velocity() * (1 + b * math.log(z_ref / 10))  # Eq 9
+    vvel = wind.v_velocity() * (1 + b * math.log(z_ref / 10))  # Eq 9
     return WindData(wind.date(), wind.wind_grid(), uvel, vvel)
 
 
 def zref_to_ten(z0, wind):
     # Scale using equations 9 & 10 here: https://dr.lib.iastate.edu/handle/20.500.12876/1131
     z_ref = 80  # Per Isaac the logarithmic profile only applies in the near surface layer, which extends roughly 80m up; to verify with lit review
-    b = 1 / (numpy.log(10) - numpy.log(z0))  # Eq 10
-    uvel = wind.u_velocity() / (1 + b * numpy.log(z_ref / 10))  # Eq 9
-    vvel = wind.v_velocity() / (1 + b * numpy.log(z_ref / 10))  # Eq 9
+    b = 1 / (math.log(10) - numpy.log(z0))  # Eq 10
+    uvel = wind.u_velocity() / (1 + b * math.log(z_ref / 10))  # Eq 9
+    vvel = wind.v_velocity() / (1 + b * math.log(z_ref / 10))  # Eq 9
     return WindData(wind.date(), wind.wind_grid(), uvel, vvel)
 
 
@@ -639,6 +2113,33 @@ def generate_ctr_interpolant():
     return lon_ctr_interpolant, lat_ctr_interpolant, time_ctr_date_0
 
 
+def within_distance(wind_grid, lon_ctr, lat_ctr, radius):
+    # Mask of the wind grid points within radius (m) of (lon_ctr, lat_ctr) by great-circle distance on a sphere of the mean earth radius
+    # Only the rows and columns of the bounding box around the circle are tested; its half-widths are exact on the sphere
+    mask = numpy.zeros((wind_grid.n_latitude(), wind_grid.n_longitude()), dtype=bool)
+    cos_lat, sin_lat, cos_lon, sin_lon = wind_grid.unit_sphere()
+    angle = radius / MEAN_EARTH_RADIUS
+    if angle >= math.pi:
+        mask[:] = True
+        return mask
+    dlat = math.degrees(angle)
+    rows = numpy.flatnonzero(numpy.abs(wind_grid.lat1d() - lat_ctr) <= dlat + 1e-9)
+    sin_dlon = math.sin(angle) / math.cos(math.radians(lat_ctr)) if abs(lat_ctr) < 90 else 2
+    if sin_dlon >= 1 or lat_ctr + dlat >= 90 or lat_ctr - dlat <= -90:
+        cols = numpy.arange(wind_grid.n_longitude())  # The circle reaches a pole or wraps all longitudes
+    else:
+        cols = numpy.flatnonzero(angle_diff(wind_grid.lon1d(), lon_ctr) <= math.degrees(math.asin(sin_dlon)) + 1e-9)
+    if rows.size == 0 or cols.size == 0:
+        return mask
+    # Dot product of the unit vectors of each point and the center; within radius when it is at least cos(angle)
+    lon_ctr_rad = math.radians(lon_ctr)
+    lat_ctr_rad = math.radians(lat_ctr)
+    cos_dlon = cos_lon[cols] * math.cos(lon_ctr_rad) + sin_lon[cols] * math.sin(lon_ctr_rad)
+    dot = math.sin(lat_ctr_rad) * sin_lat[rows, None] + math.cos(lat_ctr_rad) * cos_lat[rows, None] * cos_dlon[None, :]
+    mask[numpy.ix_(rows, cols)] = dot >= math.cos(angle)
+    return mask
+
+
 def blend(param_wind, back_wind, lon_ctr_interpolant, lat_ctr_interpolant, rmw_interpolant, time_ctr_date_0, time_rmw_date_0):
     # NOTE: This function assumes back_wind and param_wind have the same spatial and temporal resolution
     # Determine storm center location at param_wind.date()
@@ -655,15 +2156,11 @@ def blend(param_wind, back_wind, lon_ctr_interpolant, lat_ctr_interpolant, rmw_i
     max_wind = mag_param.max()
     low_lim = min(low_pct_of_max * max_wind, 15.5)
     high_lim = min(high_pct_of_max * max_wind, 20.5)
-    lon_ctr_interp_grid = numpy.zeros((param_wind.wind_grid().lon1d().size, param_wind.wind_grid().lat1d().size)) + lon_ctr_interp
-    lat_ctr_interp_grid = numpy.zeros((param_wind.wind_grid().lon1d().size, param_wind.wind_grid().lat1d().size)) + lat_ctr_interp
-    wgs84_geod = pyproj.Geod(ellps='WGS84')
-    _, _, dist_from_ctr = wgs84_geod.inv(lon_ctr_interp_grid, lat_ctr_interp_grid, param_wind.wind_grid().lon(), param_wind.wind_grid().lat())
-    rmw_mask = dist_from_ctr <= rmw_interp  # Make sure we don't blend within the RMW
+    rmw_mask = within_distance(param_wind.wind_grid(), float(lon_ctr_interp), float(lat_ctr_interp), float(rmw_interp))  # Make sure we don't blend within the RMW
     blend_mask = (low_lim < mag_param) & (mag_param < high_lim) & ~rmw_mask
     back_mask = (mag_param <= low_lim) & ~rmw_mask
-    u_blend = param_wind.u_velocity()
-    v_blend = param_wind.v_velocity()
+    u_blend = param_wind.u_velocity().copy()  # Copies, so the caller's wind is left as it was
+    v_blend = param_wind.v_velocity().copy()
     alpha = (mag_param - low_lim) / (high_lim - low_lim)
     u_blend[blend_mask] = (alpha[blend_mask] * param_wind.u_velocity()[blend_mask]) + ((1 - alpha[blend_mask]) * back_wind.u_velocity()[blend_mask])
     v_blend[blend_mask] = (alpha[blend_mask] * param_wind.v_velocity()[blend_mask]) + ((1 - alpha[blend_mask]) * back_wind.v_velocity()[blend_mask])
@@ -672,45 +2169,100 @@ def blend(param_wind, back_wind, lon_ctr_interpolant, lat_ctr_interpolant, rmw_i
     return WindData(param_wind.date(), param_wind.wind_grid(), u_blend, v_blend)
 
 
-def subd_prep(z0_hr, z0_directional_interpolant, threads):
+def subd_prep(z0_hr, z0_directional, wind_plan, threads):
     # Define subdomain indices for multiprocessing; subdomains are comprised of full rows and they are as close to the same size as possible
     subd_rows = math.floor(z0_hr.lat().size / threads)
-    subd_start_index = numpy.zeros([threads, 1], dtype=int)
-    subd_end_index = numpy.zeros([threads, 1], dtype=int)
+    subd_start_index = [0] * threads
+    subd_end_index = [0] * threads
     for i in range(0, threads):
         subd_end_index[i] = subd_rows * (i + 1)
     for i in range(0, z0_hr.lat().size % threads):
         subd_end_index[threads - (i + 1)] = subd_end_index[threads - (i + 1)] + (z0_hr.lat().size % threads - i)
     for i in range(1, threads):
         subd_start_index[i] = subd_end_index[i - 1]
-    # Calculate subdomain quantities that will be used for each time slice
-    subd_z0_hr = [[] for i in range(threads)]
-    subd_z0_directional_interpolant = [[] for i in range(threads)]
+    # Plan each subdomain once; the plans hold everything that will be used for each time slice
+    subd_plan = [[] for i in range(threads)]
     for i in range(0, threads):
-        subd_z0_hr[i] = Roughness(z0_hr.lon(), z0_hr.lat()[int(subd_start_index[i]):int(subd_end_index[i])],
-                                  z0_hr.land_rough()[int(subd_start_index[i]):int(subd_end_index[i]), :])
-        subd_z0_directional_interpolant[i] = scipy.interpolate.RegularGridInterpolator((z0_directional_interpolant.grid[0][int(subd_start_index[i]):int(subd_end_index[i])],
-                                                                                        z0_directional_interpolant.grid[1][:], z0_directional_interpolant.grid[2][:]),
-                                                                                       z0_directional_interpolant.values[int(subd_start_index[i]):int(subd_end_index[i]), :, :], method='linear')
-    return subd_z0_hr, subd_z0_directional_interpolant, subd_start_index, subd_end_index
+        subd_z0_hr = Roughness(z0_hr.lon(), z0_hr.lat()[subd_start_index[i]:subd_end_index[i]],
+                               z0_hr.land_rough()[subd_start_index[i]:subd_end_index[i], :])
+        subd_plan[i] = SubdomainPlan.create(wind_plan, subd_z0_hr, z0_directional.subset(subd_start_index[i], subd_end_index[i]))
+    return subd_plan, subd_start_index, subd_end_index
+
 
+def roughness_adjust_domain(subd_inputs):
+    # roughness_adjust for a single whole-domain task, returning the same (u, v, date) as subd_restitch_domain
+    wind_scaled = roughness_adjust(subd_inputs)
+    return wind_scaled.u_velocity(), wind_scaled.v_velocity(), wind_scaled.date()
 
-def subd_restitch_domain(subd_wind_scaled, subd_start_index, subd_end_index, hr_shape, threads):
-    u_scaled = numpy.zeros(hr_shape)
-    v_scaled = numpy.zeros(hr_shape)
+
+def subd_restitch_domain(subd_wind_scaled, subd_start_index, subd_end_index, hr_shape, threads, dtype=numpy.float64):
+    u_scaled = numpy.zeros(hr_shape, dtype)
+    v_scaled = numpy.zeros(hr_shape, dtype)
     for i, subd in enumerate(subd_wind_scaled):
-        u_scaled[int(subd_start_index[i]):int(subd_end_index[i]), :] = subd.u_velocity()
-        v_scaled[int(subd_start_index[i]):int(subd_end_index[i]), :] = subd.v_velocity()
+        u_scaled[subd_start_index[i]:subd_end_index[i], :] = subd.u_velocity()
+        v_scaled[subd_start_index[i]:subd_end_index[i], :] = subd.v_velocity()
         if i == 0:
             date = subd.date()
     return u_scaled, v_scaled, date
 
 
+def read_wind_slices(reader, num_times, progress=False):
+    # Read each time slice only when it is asked for, e.g. by WindScaler.stream
+    for time_index in range(0, num_times):
+        if progress:
+            print("INFO: Processing time slice {:d} of {:d}".format(time_index + 1, num_times), flush=True)
+        stage_start = profile_start()
+        wind = reader.get(time_index)
+        if profiler is not None:
+            profiler.record("read", stage_start, time_index, None, wind.u_velocity().size)
+        yield wind
+
+
 def is_valid(args):
     if args.wfmt == args.wbackfmt:
         print("ERROR: wfmt and wbackfmt cannot match. Please try again.", flush=True)
     elif args.sl != "adcirc" and args.sl != "up-down":
         print("ERROR: Unsupported scaling logic. Please try again.", flush=True)
+    elif args.pool != "thread" and args.pool != "process":
+        print("ERROR: Unsupported pool type. Please try again.", flush=True)
+    elif args.precision != "float64" and args.precision != "float32":
+        print("ERROR: Unsupported precision. Please try again.", flush=True)
+    elif args.z0method != "fft" and args.z0method != "loop":
+        print("ERROR: Unsupported z0 generation method. Please try again.", flush=True)
+    elif args.z0dtype != "float64" and args.z0dtype != "float32":
+        print("ERROR: Unsupported z0 storage type. Please try again.", flush=True)
+    elif args.z0cachesize < 0:
+        print("ERROR: z0cachesize cannot be negative. Please try again.", flush=True)
+    elif args.z0tile < 0:
+        print("ERROR: z0tile cannot be negative. Please try again.", flush=True)
+    elif args.z0tile > 0 and args.z0method != "fft":
+        print("ERROR: z0tile requires z0method fft. Please try again.", flush=True)
+    elif args.ocomplevel < 0 or args.ocomplevel > 9:
+        print("ERROR: ocomplevel must be between 0 and 9. Please try again.", flush=True)
+    elif args.ochunk is not None and min(args.ochunk) < 1:
+        print("ERROR: ochunk sizes must be positive. Please try again.", flush=True)
+    elif args.ofmt != "netcdf" and args.ofmt != "chunked":
+        print("ERROR: Unsupported output format. Please try again.", flush=True)
+    elif args.bbox is not None and args.mask is not None:
+        print("ERROR: bbox and mask cannot both be provided. Please try again.", flush=True)
+    elif args.bbox is not None and (args.bbox[0] > args.bbox[2] or args.bbox[1] > args.bbox[3]):
+        print("ERROR: bbox must be lon_min lat_min lon_max lat_max. Please try again.", flush=True)
+    elif args.ouv and args.ofmt != "netcdf":
+        print("ERROR: ouv requires ofmt netcdf. Please try again.", flush=True)
+    elif args.owriters < 1:
+        print("ERROR: owriters must be at least 1. Please try again.", flush=True)
+    elif args.owriters > 1 and (args.ofmt != "chunked" or not args.wasync):
+        print("ERROR: owriters greater than 1 requires ofmt chunked and wasync. Please try again.", flush=True)
+    elif args.wqueue < 1:
+        print("ERROR: wqueue must be at least 1. Please try again.", flush=True)
+    elif args.tslices < 0:
+        print("ERROR: tslices cannot be negative. Please try again.", flush=True)
+    elif args.hrblock < 0:
+        print("ERROR: hrblock cannot be negative. Please try again.", flush=True)
+    elif args.hrblock > 0 and args.hrblock < 2 * (1 if args.tslices > 0 else args.t):
+        print("ERROR: hrblock must be at least 2 rows per subdomain (2 times t, or 2 if tslices is set). Please try again.", flush=True)
+    elif args.hrblock > 0 and args.ofmt != "netcdf":
+        print("ERROR: hrblock requires ofmt netcdf. Please try again.", flush=True)
     elif args.wfmt != "owi-ascii" and args.wfmt != "owi-netcdf" and args.wfmt != "wnd":
         print("ERROR: Unsupported wind format. Please try again.", flush=True)
     elif args.wback is not None and args.wbackfmt != "owi-ascii" and args.wbackfmt != "owi-netcdf":
@@ -732,8 +2284,50 @@ def is_valid(args):
 
 def build_parser():
     parser = argparse.ArgumentParser(description="Scale and subset input wind data based on high-resolution land roughness")
+    parser.add_argument("-bbox", metavar=("lon_min", "lat_min", "lon_max", "lat_max"), type=float, nargs=4,
+                        help="Only scale and output the points of the high-res roughness grid inside this bounding box", required=False)
     parser.add_argument("-hr", metavar="highres_roughness", type=str, help="High-resolution land roughness file", required=True)
+    parser.add_argument("-hrblock", metavar="hr_block_rows", type=int,
+                        help="Stream the high-res grid in blocks of this many rows: each block is read from hr, scaled for every time slice and written "
+                        + "to its rows of the output before the next block is read, so memory use is set by the block size rather than the grid size. "
+                        + "Wind files are read once per block. Requires ofmt netcdf; unless ochunk is provided, output chunks are one block of one time slice. "
+                        + "Directional z0 must be in the memory-mapped .npy format for its memory use to be bounded too. 0 disables", required=False, default=0)
+    parser.add_argument("-mask", metavar="mask", type=str,
+                        help="NetCDF file with lat, lon and mask variables on a block of the high-res roughness grid; only that block is scaled and output, "
+                        + "and points where mask is 0 are written as NaN", required=False)
+    parser.add_argument("-mmap", help="Add this flag to memory-map OWI ASCII and WND wind files instead of reading them into memory; "
+                        + "OWI ASCII time slice offsets are indexed once and saved alongside the wind file as <file>.idx.npy", action='store_true', required=False, default=False)
     parser.add_argument("-o", metavar="outfile", type=str, help="Name of output file to be created", required=False, default="scaled_wind")
+    parser.add_argument("-ochunk", metavar=("time", "latitude", "longitude"), type=int, nargs=3,
+                        help="Chunk shape of spd and dir in the output file; the netCDF4 default is used if not provided. "
+                        + "With ofmt chunked, time chunks are always 1 and latitude/longitude default to 512", required=False)
+    parser.add_argument("-ocomplevel", metavar="complevel", type=int, help="zlib compression level (0-9) of spd and dir in the output file; 0 disables compression",
+                        required=False, default=2)
+    parser.add_argument("-ofmt", metavar="output_format", type=str,
+                        help="Format of the output. Supported values: netcdf (<o>.nc), chunked (<o>.chunks, a directory of separately compressed chunks "
+                        + "that several writer threads can append to at once; convert it with chunked_to_netcdf.py)", required=False, default='netcdf')
+    parser.add_argument("-opack", help="Add this flag to store spd and dir as int16 with scale_factor/add_offset (0.01 m/s and 0.01 degree resolution) "
+                        + "instead of float32; points without a direction are stored as the fill value", action='store_true', required=False, default=False)
+    parser.add_argument("-ouv", help="Add this flag to also write the U10 and V10 wind components to the output file; requires ofmt netcdf",
+                        action='store_true', required=False, default=False)
+    parser.add_argument("-owriters", metavar="output_writers", type=int,
+                        help="Number of writer threads when wasync is true; more than 1 requires ofmt chunked", required=False, default=1)
+    parser.add_argument("-oshuffle", metavar="shuffle", type=int, choices=[0, 1], nargs="?", const=1,
+                        help="1 (the default, as netCDF4 does) applies the HDF5 shuffle filter before compressing spd and dir; 0 disables it",
+                        required=False, default=1)
+    parser.add_argument("-pool", metavar="pool_type", type=str,
+                        help="Type of worker pool used for subdomain calculations. Supported values: thread, process. "
+                        + "process avoids the GIL and keeps static high-res arrays in shared memory", required=False, default='thread')
+    parser.add_argument("-profile", "--profile", metavar="profile", type=str,
+                        help="Record the wall time of each stage (read, wind_adjust, interpolate, directional z0, scale, restitch, write) per time slice "
+                        + "and subdomain, with the process's peak resident memory over it, and write them to <profile>.csv with a summary by stage, worker and slice and the overall "
+                        + "time slices and points per second in <profile>.json", required=False)
+    parser.add_argument("-precision", "--precision", metavar="precision", type=str,
+                        help="Floating-point type of the roughness fields, regridding weights, winds and scaling math. Supported values: float64, "
+                        + "float32 (half the memory traffic and size of every per-slice array). benchmark_scale_and_subset.py -b pipeline "
+                        + "-precision float64 float32 reports the difference; on its default synthetic inputs, spd was within 4e-5 m/s and dir "
+                        + "within 5e-3 degrees of float64, with no direction at the same points. "
+                        + "With float32, also consider z0dtype float32 so the directional z0 file is stored in the same precision", required=False, default='float64')
     parser.add_argument("-r", metavar="radius", type=int,
                         help="Sector radius for directional z0 calculation, in meters; will be ignored if z0sv is false", required=False, default=3000)
     parser.add_argument("-sigma", metavar="sigma", type=int,
@@ -741,10 +2335,14 @@ def build_parser():
     parser.add_argument("-sl", metavar="scale_logic", type=str,
                         help="Which logic to use for the directional z0 adjustment. Supported values: adcirc, up-down", required=False, default='adcirc')
     parser.add_argument("-t", metavar="threads", type=int,
-                        help="Number of threads to use for calculations; must not exceed the number available; total threads = t + wasync", required=False, default=1)
+                        help="Number of threads (or processes, if pool is process) to use for calculations; must not exceed the number available; "
+                        + "total threads = t + wasync", required=False, default=1)
+    parser.add_argument("-tslices", metavar="time_slices", type=int,
+                        help="Process up to this many time slices at once, each as one whole-domain task, instead of splitting every slice into row subdomains; "
+                        + "useful for small high-res grids. Output is still written in time order. 0 disables", required=False, default=0)
     parser.add_argument("-w", metavar="wind", type=str, help="Wind file to be scaled and subsetted", required=True)
     parser.add_argument("-wasync", help="Add this flag to begin scaling winds for the next time step while writing the output for the current time step; "
-                        + "writes run in series and are thread safe, but peak memory use may be high if write times are slower than computation times; "
+                        + "writes run in series on one writer thread, and at most wqueue time slices wait to be written; "
                         + "total threads = t + wasync", action='store_true', required=False, default=False)
     parser.add_argument("-wback", metavar="wind_background", type=str,
                         help="Background wind to be blended with the wind file; if included, w and wback will be blended", required=False)
@@ -752,16 +2350,41 @@ def build_parser():
                         help="Format of the input background wind file. Supported values: owi-ascii, owi-netcdf. Required if wback is provided.", required=False)
     parser.add_argument("-wbackr", metavar="wback_roughness", type=str,
                         help="Wind-resolution land roughness file; required if wbackfmt is owi-ascii or owi-netcdf", required=False)
+    parser.add_argument("-wcache", metavar="wind_cache_size", type=int,
+                        help="Chunk cache size for OWI NetCDF wind variables, in bytes; by default it is sized to hold every chunk touched by one time slice",
+                        required=False)
     parser.add_argument("-wfmt", metavar="w_format", type=str,
                         help="Format of the input wind file. Supported values: owi-ascii, owi-netcdf, wnd. If wback is provided, this must be wnd.", required=True)
     parser.add_argument("-winp", metavar="wind_inp", type=str,
                         help="Wind_Inp.txt metadata file; required if wfmt is wnd", required=False)
+    parser.add_argument("-wpreempt", metavar="wind_cache_preemption", type=float,
+                        help="Chunk cache preemption for OWI NetCDF wind variables, between 0 and 1; uses the netCDF4 default if not provided", required=False)
+    parser.add_argument("-wqueue", metavar="write_queue_depth", type=int,
+                        help="Maximum number of time slices waiting to be written when wasync is true; computation waits when the queue is full",
+                        required=False, default=2)
     parser.add_argument("-wr", metavar="wind_roughness", type=str,
                         help="Wind-resolution land roughness file; required if wfmt is owi-ascii or owi-netcdf", required=False)
     parser.add_argument("-z0sv", help="Add this flag to generate and save off a directional z0 interpolant; do this in advance to save time during regular runs",
                         action='store_true', required=False, default=False)
+    parser.add_argument("-z0cache", metavar="z0_cache_dir", type=str,
+                        help="Directory of directional z0 files keyed by the contents of hr, sigma, r and z0dtype. A matching file is used if there is one "
+                        + "and generated and added otherwise, so z0sv and z0name are not needed. The digest of hr is kept there too (next to the output "
+                        + "file without a cache), so an unchanged hr is only hashed once", required=False)
+    parser.add_argument("-z0cachesize", metavar="z0_cache_size", type=float,
+                        help="Size limit of z0cache, in GB; least recently used files are removed past it", required=False, default=50)
+    parser.add_argument("-z0dtype", metavar="z0_dtype", type=str,
+                        help="Storage type of the directional z0 file when z0sv is true. Supported values: float64, float32 (half the size; "
+                        + "z0 rounded to about 7 significant digits)", required=False, default='float64')
+    parser.add_argument("-z0method", metavar="z0_method", type=str,
+                        help="How to generate the directional z0 interpolant when z0sv is true. Supported values: fft (convolution-based), "
+                        + "loop (original point-by-point sums; much slower, same result)", required=False, default='fft')
+    parser.add_argument("-z0tile", metavar="z0_tile_size", type=int,
+                        help="Generate the directional z0 interpolant in tiles of this many points per side on t processes when z0sv is true; "
+                        + "finished tiles are kept in <z0name>.partial.npy so an interrupted run resumes where it left off. 0 disables tiling",
+                        required=False, default=0)
     parser.add_argument("-z0name", metavar="z0_name", type=str,
-                        help="Name of directional z0 interpolant file; it will be generated if z0sv is True and loaded if z0sv is False", required=False, default='z0_interp')
+                        help="Name of directional z0 file, saved as <z0name>.npy and <z0name>.json; it will be generated if z0sv is True and loaded if z0sv is False. "
+                        + "A legacy <z0name>.pickle is loaded if there is no <z0name>.json", required=False, default='z0_interp')
     return parser
 
 
@@ -773,126 +2396,199 @@ def main():
     args = parser.parse_args()
     if not is_valid(args):
         return
+    dtype = numpy.dtype(args.precision)  # Everything calculated per time slice is in this precision
+    global profiler
+    if args.profile is not None:
+        profiler = Profiler()
 
     # Create wind files, set num_times
     if args.wfmt == "owi-ascii":
-        win_file = open(args.w, 'r')
-        lines = win_file.readlines()
-        win_file.close()
-        owi_ascii = OwiAsciiWind(lines)
-        num_times = owi_ascii.num_times()
+        if args.mmap:
+            wind_reader = OwiAsciiWindMmap(args.w)
+        else:
+            win_file = open(args.w, 'r')
+            lines = win_file.readlines()
+            win_file.close()
+            wind_reader = OwiAsciiWind(lines)
+        num_times = wind_reader.num_times()
     elif args.wfmt == "owi-netcdf":
-        owi_netcdf = OwiNetcdf(args.w)
-        num_times = owi_netcdf.num_times()
+        wind_reader = OwiNetcdf(args.w, args.wcache, args.wpreempt)
+        num_times = wind_reader.num_times()
     elif args.wfmt == "wnd":
         metadata = WndWindInp(args.winp)
         num_times = metadata.num_times()
-        wnd_file = open(args.w, 'r')
-        lines = wnd_file.readlines()
-        wnd_file.close()
-        wnd = WndWind(lines, metadata)
+        if args.mmap:
+            wind_reader = WndWindMmap(args.w, metadata)
+        else:
+            wnd_file = open(args.w, 'r')
+            lines = wnd_file.readlines()
+            wnd_file.close()
+            wind_reader = WndWind(lines, metadata)
+    wback_reader = None
     if args.wbackfmt == "owi-ascii":
-        win_file = open(args.wback, 'r')
-        lines = win_file.readlines()
-        win_file.close()
-        owi_ascii = OwiAsciiWind(lines)
+        if args.mmap:
+            wback_reader = OwiAsciiWindMmap(args.wback)
+        else:
+            win_file = open(args.wback, 'r')
+            lines = win_file.readlines()
+            win_file.close()
+            wback_reader = OwiAsciiWind(lines)
     elif args.wbackfmt == "owi-netcdf":
-        owi_netcdf = OwiNetcdf(args.wback)
+        wback_reader = OwiNetcdf(args.wback, args.wcache, args.wpreempt)
 
     # If blending, generate interpolants used for every time slice
+    blend_inputs = None
     if args.wback is not None:
         lon_ctr_interpolant, lat_ctr_interpolant, time_ctr_date_0 = generate_ctr_interpolant()
         rmw_interpolant, time_rmw_date_0 = generate_rmw_interpolant()
+        blend_inputs = (lon_ctr_interpolant, lat_ctr_interpolant, rmw_interpolant, time_ctr_date_0, time_rmw_date_0)
 
     # Define roughness grids
     if (args.wfmt == "owi-ascii") | (args.wfmt == "owi-netcdf"):
         wr_lon, wr_lat, wr_land_rough = Roughness.get(args.wr)
-        z0_wr = Roughness(wr_lon, wr_lat, wr_land_rough)
+        z0_wr = Roughness(wr_lon, wr_lat, wr_land_rough.astype(dtype, copy=False))
     elif args.wfmt == "wnd":
         z0_wnd = 0.0033
-        wr_land_rough = numpy.zeros((metadata.num_lats(), metadata.num_lons())) + z0_wnd  # z0_wr defined below, after wnd grid is available
+        wr_land_rough = numpy.zeros((metadata.num_lats(), metadata.num_lons()), dtype) + z0_wnd
+        z0_wr = Roughness(wind_reader.grid().lon1d(), wind_reader.grid().lat1d(), wr_land_rough)
+    z0_wbackr = None
     if (args.wbackfmt == "owi-ascii") | (args.wbackfmt == "owi-netcdf"):
         wbackr_lon, wbackr_lat, wbackr_land_rough = Roughness.get(args.wbackr)
-        z0_wbackr = Roughness(wbackr_lon, wbackr_lat, wbackr_land_rough)
-    hr_lon, hr_lat, hr_land_rough = Roughness.get(args.hr)
-    z0_hr = Roughness(hr_lon, hr_lat, hr_land_rough)
-    lon_grid, lat_grid = numpy.meshgrid(z0_hr.lon(), z0_hr.lat())
-
-    # Generate or load directional z0 interpolants
-    if args.z0sv:
-        print("INFO: z0sv is True, so a directional z0 interpolant file will be generated. This will take a while.", flush=True)
+        z0_wbackr = Roughness(wbackr_lon, wbackr_lat, wbackr_land_rough.astype(dtype, copy=False))
+    # With a bounding box or mask, only that block of the high-res grid is read, scaled and written
+    hr_window = None
+    hr_mask = None
+    if args.bbox is not None:
+        hr_window = Roughness.bbox_window(args.hr, args.bbox)
+    elif args.mask is not None:
+        hr_window, hr_mask = Roughness.mask_window(args.hr, args.mask)
+    # When streaming, roughness is read one block at a time later on
+    z0_hr = None
+    if args.hrblock > 0:
+        hr_lon, hr_lat = Roughness.get_axes(args.hr, hr_window)
+    else:
+        hr_lon, hr_lat, hr_land_rough = Roughness.get(args.hr, hr_window)
+        z0_hr = Roughness(hr_lon, hr_lat, hr_land_rough)
+    if hr_window is not None:
+        print("INFO: Scaling a {:d} x {:d} block of the high-res roughness grid".format(len(hr_lat), len(hr_lon)), flush=True)
+
+    # Generate or load directional z0
+    # With a cache directory, the product is found by a hash of the high-res roughness file, sigma and radius instead of by z0name
+    # The high-res roughness file is only hashed when a product is looked up by, saved with or checked against its digest
+    stage_start = profile_start()
+    # Its digest is kept in the cache directory, or else next to the output file
+    hr_sha256 = None
+    digest_dir = args.z0cache if args.z0cache is not None else os.path.dirname(os.path.abspath(args.o))
+    z0_name = args.z0name
+    z0_generate = args.z0sv
+    if args.z0cache is not None:
+        os.makedirs(args.z0cache, exist_ok=True)
+        hr_sha256 = file_sha256(args.hr, digest_dir)
+        z0_name = os.path.join(args.z0cache, directional_z0_cache_key(hr_sha256, args.sigma, args.r, args.z0dtype))
+        z0_generate = args.z0sv or not os.path.exists(z0_name + ".json")
+        if not z0_generate:
+            print("INFO: Found directional z0 for this high-res roughness file, sigma, radius and z0dtype in the cache", flush=True)
+        elif not args.z0sv:
+            print("INFO: No directional z0 for this high-res roughness file, sigma, radius and z0dtype in the cache, so one will be generated. "
+                  + "This will take a while.", flush=True)
+    if z0_generate:
+        if args.z0sv:
+            print("INFO: z0sv is True, so a directional z0 interpolant file will be generated. This will take a while.", flush=True)
         print("INFO: Generating directional z0 interpolant...", flush=True)
-        z0_directional_interpolant = generate_directional_z0_interpolant(lon_grid, lat_grid, z0_hr.land_rough(), args.sigma, args.r)
-        with open(args.z0name + '.pickle', 'wb') as file:
-            pickle.dump(z0_directional_interpolant, file, pickle.HIGHEST_PROTOCOL)
+        if hr_sha256 is None:
+            hr_sha256 = file_sha256(args.hr, digest_dir)
+        # Always for the whole grid, so the cones near the edge of a block still see the roughness outside it
+        if args.z0tile > 0:
+            # The tile workers read the roughness they need themselves, so only the axes are read here
+            full_lon, full_lat = Roughness.get_axes(args.hr)
+            z0_directional_interpolant = generate_directional_z0_tiled(args.hr, full_lon, full_lat, args.sigma, args.r, args.z0tile, args.t,
+                                                                       z0_name + '.partial', hr_sha256)
+        else:
+            z0_full = z0_hr if hr_window is None and z0_hr is not None else Roughness(*Roughness.get(args.hr))
+            lon_grid, lat_grid = numpy.meshgrid(z0_full.lon(), z0_full.lat())
+            z0_directional_interpolant = generate_directional_z0_interpolant(lon_grid, lat_grid, z0_full.land_rough(), args.sigma, args.r, args.z0method)
+            del lon_grid, lat_grid, z0_full
+        DirectionalZ0.from_interpolant(z0_directional_interpolant, args.sigma, args.r, hr_sha256).save(z0_name, args.z0dtype)
+        del z0_directional_interpolant
+        if args.z0tile > 0:
+            remove_directional_z0_tiles(z0_name + '.partial')
     else:
         print("INFO: Loading directional z0 interpolant...", flush=True)
-        with open(args.z0name + '.pickle', 'rb') as file:
-            z0_directional_interpolant = pickle.load(file)
-
-    # Define subdomains for multiprocessing
-    subd_z0_hr, subd_z0_directional_interpolant, subd_start_index, subd_end_index = subd_prep(z0_hr, z0_directional_interpolant, args.t)
-
-    # Scale wind one time slice at a time
-    wind = None
-    time_index = 0
-    if args.wasync:
-        write_thread = [[] for i in range(num_times)]
-        lock = threading.Lock()
-        did_warn = False
-    with concurrent.futures.ThreadPoolExecutor(max_workers=args.t) as executor:
-        for time_index in range(0, num_times):
-            print("INFO: Processing time slice {:d} of {:d}".format(time_index + 1, num_times), flush=True)
-            subd_inputs = [[] for i in range(args.t)]
-            # Generate inputs for roughness_adjust
-            if args.wfmt == "owi-ascii":
-                input_wind = owi_ascii.get(time_index)
-            elif args.wfmt == "owi-netcdf":
-                input_wind = owi_netcdf.get(time_index)
-            elif args.wfmt == "wnd":
-                input_wind = wnd.get(time_index)
-                if time_index == 0:
-                    z0_wr = Roughness(input_wind.wind_grid().lon1d(), input_wind.wind_grid().lat1d(), wr_land_rough)
-            if args.wback is not None:
-                if args.wbackfmt == 'owi-ascii':
-                    input_wback = owi_ascii.get(time_index)
-                elif args.wbackfmt == 'owi-netcdf':
-                    input_wback = owi_netcdf.get(time_index)
-                for i in range(0, args.t):
-                    subd_inputs[i] = [input_wind, input_wback, args.wfmt, args.wbackfmt, z0_wr, z0_wbackr, subd_z0_hr[i], subd_z0_directional_interpolant[i],
-                                      args.sl, lon_ctr_interpolant, lat_ctr_interpolant, rmw_interpolant, time_ctr_date_0, time_rmw_date_0]
-            else:
-                for i in range(0, args.t):
-                    subd_inputs[i] = [input_wind, None, args.wfmt, None, z0_wr, None, subd_z0_hr[i], subd_z0_directional_interpolant[i],
-                                      args.sl, None, None, None, None, None]
-            # Call roughness_adjust for each subdomain
-            subd_wind_scaled = executor.map(roughness_adjust, subd_inputs)
-            u_scaled, v_scaled, date = subd_restitch_domain(subd_wind_scaled, subd_start_index, subd_end_index, z0_hr.land_rough().shape, args.t)
-            wind_scaled = WindData(date, WindGrid(z0_hr.lon(), z0_hr.lat()), u_scaled, v_scaled)
-            # Write to NetCDF; single-threaded with optional asynchronicity for now, as thread-safe NetCDF is complicated
-            if not wind:
-                wind = NetcdfOutput(args.o, z0_hr.lon(), z0_hr.lat())
-            if args.wasync:
-                if time_index > 0 and not did_warn and write_thread[time_index - 1].is_alive():
-                    print("WARNING: NetCDF writes are taking longer than computations. This may result in higher memory use. "
-                          + "Especially if this warning appears early, consider using fewer threads or disabling asynchronous writes.", flush=True)
-                    did_warn = True
-                write_thread[time_index] = threading.Thread(target=wind.append, args=(time_index, wind_scaled.date(),
-                                                                                      wind_scaled.u_velocity(), wind_scaled.v_velocity(), lock))
-                write_thread[time_index].start()
-            else:
-                wind.append(time_index, wind_scaled.date(), wind_scaled.u_velocity(), wind_scaled.v_velocity(), None)
-        # If writes are asynchronous, wait for all threads to return
-        if args.wasync:
-            for i in range(0, num_times):
-                if write_thread[i].is_alive():
-                    print("INFO: Still writing output to NetCDF for time slice {:d} of {:d}".format(i + 1, num_times), flush=True)
-                write_thread[i].join()
+    z0_directional = DirectionalZ0.load(z0_name)
+    if hr_window is not None:
+        z0_directional = z0_directional.restrict(hr_lon, hr_lat)
+    # A product found in the cache or just generated matches by construction; one loaded by name may not
+    if hr_sha256 is None and z0_directional.source_sha256() is not None and z0_directional.source_sha256() != file_sha256(args.hr, digest_dir):
+        print("WARNING: " + z0_name + " was generated from a different high-res roughness file than " + args.hr, flush=True)
+    if args.z0cache is not None:
+        os.utime(z0_name + ".json")
+        evict_directional_z0_cache(args.z0cache, args.z0cachesize * 2**30, z0_name)
+    if profiler is not None:
+        profiler.record("directional z0 setup", stage_start)
+
+    # Plan the static roughness fields once on the wind grid
+    wind_plan = WindPlan(args.sl, wind_reader.grid(), z0_wr, wback_reader.grid() if wback_reader is not None else None, z0_wbackr, args.wfmt == "wnd")
+
+    # With hrblock, the high-res grid is streamed in blocks of rows; every time slice is scaled and written for one block before the next is read
+    # A remainder too small to split into subdomains is added to the last block
+    subdomains = 1 if args.tslices > 0 else args.t
+    block_rows = args.hrblock if args.hrblock > 0 else len(hr_lat)
+    block_start_index = list(range(0, len(hr_lat), block_rows))
+    if len(block_start_index) > 1 and len(hr_lat) - block_start_index[-1] < 2 * subdomains:
+        block_start_index.pop()
+    block_end_index = block_start_index[1:] + [len(hr_lat)]
+    hr_row_offset, hr_col_start, hr_col_end = (0, 0, len(hr_lon)) if hr_window is None else (hr_window[0], hr_window[2], hr_window[3])
+    ochunk = args.ochunk
+    if args.hrblock > 0 and ochunk is None:
+        ochunk = [1, block_rows, len(hr_lon)]  # So each output chunk is written once, rather than read back and rewritten for every block
+
+    # Scale wind one time slice at a time, or several at once if tslices is set; either way, output is written in time order
+    # Writes are single-threaded with optional asynchronicity for now, as thread-safe NetCDF is complicated
+    output_type = NetcdfOutput if args.ofmt == "netcdf" else ChunkedOutput
+    output_options = (ochunk, args.ocomplevel, args.oshuffle == 1, args.opack) + ((args.ouv,) if args.ouv else ())
+    writer = OutputWriter(output_type(args.o, hr_lon, hr_lat, *output_options), args.wasync, args.wqueue, args.owriters, hr_mask)
+    for block_start, block_end in zip(block_start_index, block_end_index):
+        if args.hrblock > 0:
+            print("INFO: Processing rows {:d} to {:d} of {:d}".format(block_start + 1, block_end, len(hr_lat)), flush=True)
+            z0_block = Roughness(*Roughness.get(args.hr, (hr_row_offset + block_start, hr_row_offset + block_end, hr_col_start, hr_col_end)))
+        else:
+            z0_block, z0_hr = z0_hr, None
+        stage_start = profile_start()
+        # High-res roughness is only converted to the run's precision now, so directional z0 is always generated from the file's own values
+        z0_block = Roughness(z0_block.lon(), z0_block.lat(), z0_block.land_rough().astype(dtype, copy=False))
+        # Plan the static roughness fields once for each subdomain of the block
+        z0_block_directional = z0_directional.subset(block_start, block_end)
+        if args.hrblock > 0 and z0_block_directional.name() is not None:
+            # Map just this block of the saved product, so its pages are released along with the block instead of accumulating
+            z0_block_directional = DirectionalZ0.load(z0_block_directional.name(), z0_block_directional.window())
+        scaler = WindScaler(wind_plan, z0_block, z0_block_directional, blend_inputs, args.t, args.pool, args.tslices)
+        if args.pool == "process" and args.hrblock == 0:
+            # The process pool has its own copy in shared memory
+            del z0_directional
+            z0_block_directional = None
+        if profiler is not None:
+            profiler.record("plan", stage_start, None, None, z0_block.land_rough().size)
+        # Read and blend on the wind grid once per slice, then scale each subdomain
+        winds = read_wind_slices(wind_reader, num_times, True)
+        wbacks = read_wind_slices(wback_reader, num_times) if wback_reader is not None else None
+        slice_start = profile_start()
+        for time_index, wind_scaled in enumerate(scaler.stream(winds, wbacks)):
+            writer.write(time_index, wind_scaled.date(), wind_scaled.u_velocity(), wind_scaled.v_velocity(), block_start)
+            if profiler is not None:
+                profiler.record("slice", slice_start, time_index, None, wind_scaled.u_velocity().size)
+                slice_start = profile_start()
+        scaler.close()
+        del scaler, z0_block, z0_block_directional
+    writer.close(num_times)
 
     # Clean up
-    if args.wfmt == "owi-netcdf" or args.wbackfmt == "owi-netcdf":
-        owi_netcdf.close()
-    wind.close()
+    for reader in (wind_reader, wback_reader):
+        if hasattr(reader, "close"):
+            reader.close()
+    if profiler is not None:
+        report = profiler.report(args.profile, num_times, len(hr_lat) * len(hr_lon))
+        print("INFO: Profile written to {:s}.json and {:s}.csv: {:.3g} time slices per second, {:.3g} points per second".format(
+            args.profile, args.profile, report["slices_per_second"], report["points_per_second"]), flush=True)
     print("RICHAMP wind generation complete. Runtime:", str(datetime.datetime.now() - start), flush=True)
 
 